@@ -1,16 +1,42 @@
 import os
+import asyncio
+import atexit
+import base64
+import csv
+import gzip
+import heapq
+import io
+import itertools
+import logging
+import logging.handlers
 import json
+import queue
+import random
+import re
+import signal
+import socket
+import sys
 import threading
 import time
+import zlib
 import requests
 import sqlite3
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from typing import Dict, List, Set
 import pytz
-from flask import Flask, jsonify, render_template_string, request
+from flask import Flask, Response, jsonify, render_template_string, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows: sin elección de líder, cada proceso hace polling
+    fcntl = None
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -21,11 +47,6 @@ CORS(app)
 # Configuración de zona horaria
 SANTIAGO_TZ = pytz.timezone('America/Santiago')
 
-# Almacenamiento de datos de usuarios
-current_viewers: Dict[str, Dict] = {}  # Usuarios actualmente viendo
-left_viewers: List[Dict] = []  # Usuarios que salieron
-all_history: List[Dict] = []  # Historial completo
-
 # Lista de bots a excluir (agrega aquí los nombres de tus bots)
 EXCLUDED_BOTS = [
     'blackcraneo',  # El bot principal
@@ -40,457 +61,3472 @@ EXCLUDED_BOTS = [
     # Agrega aquí los nombres de tus bots personalizados
 ]
 
+# Configuración de conexiones SQLite
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 20000))
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 8))
+DB_OPTIMIZE_INTERVAL = 3600  # Segundos entre PRAGMA optimize
+
+EXCLUDED_BOTS_LOWER = {bot.lower() for bot in EXCLUDED_BOTS}
+
+# Clase para manejar las conexiones a la base de datos
+class ConnectionPool:
+    """Un escritor persistente y un pool de conexiones de lectura en modo WAL"""
+
+    def __init__(self, db_path, read_pool_size=DB_READ_POOL_SIZE):
+        self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = None
+        self._readers = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+
+    def _connect(self):
+        """Abre una conexión con los pragmas de rendimiento aplicados"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None  # Transacciones explícitas con BEGIN/COMMIT
+        )
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def _get_writer(self):
+        if self._writer is None:
+            self._writer = self._connect()
+            # WAL es persistente en el archivo: lectores y escritor no se bloquean
+            self._writer.execute('PRAGMA journal_mode = WAL')
+        return self._writer
+
+    @contextmanager
+    def transaction(self):
+        """Ejecuta un bloque dentro de una única transacción de escritura"""
+        with self._write_lock:
+            conn = self._get_writer()
+            if self._write_depth > 0:
+                # Transacción anidada: se confirma junto con la externa
+                self._write_depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._write_depth -= 1
+                return
+
+            conn.execute('BEGIN IMMEDIATE')
+            self._write_depth = 1
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            finally:
+                self._write_depth = 0
+
+    @contextmanager
+    def reader(self):
+        """Presta una conexión de lectura del pool al hilo actual"""
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                if self._readers_created < self.read_pool_size:
+                    self._readers_created += 1
+                    conn = self._connect()
+            if conn is None:
+                conn = self._readers.get()
+
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        """Cierra todas las conexiones abiertas"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._readers_lock:
+            self._readers_created = 0
+
+# Canal al que pertenecen los datos guardados antes del tracking multi-canal
+LEGACY_CHANNEL = 'blackcraneo'
+
+# Máximo de filas por página en /api/history
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 200))
+
+# Ventana en memoria de /api/salieron y /api/historial (lo más antiguo se lee de SQLite)
+RECENT_BUFFER_SIZE = int(os.getenv('RECENT_BUFFER_SIZE', 500))
+VIEWER_MEMORY_SAMPLE = 100  # Sesiones medidas para estimar la memoria por espectador
+RECENT_WINDOW_DEFAULT = 50
+# OFFSET recorre todas las filas saltadas; más atrás se pagina /api/history con cursor
+RECENT_MAX_OFFSET = int(os.getenv('RECENT_MAX_OFFSET', 10000))
+
+# Feed de cambios (/api/changes)
+CHANGE_FEED_SIZE = int(os.getenv('CHANGE_FEED_SIZE', 5000))  # Cambios en memoria
+CHANGE_LOG_RETENTION = int(os.getenv('CHANGE_LOG_RETENTION', 200000))  # Cambios guardados en SQLite
+CHANGES_MAX_PAGE_SIZE = 1000
+CHANGES_MAX_WAIT = 30  # Segundos máximos de long-poll
+
+class ChangeFeed:
+    """Últimas entradas y salidas con número de secuencia creciente
+
+    Es la cola en memoria de la tabla change_log: las consultas recientes se
+    responden desde aquí y las más antiguas desde SQLite.
+    """
+    
+    def __init__(self, size=CHANGE_FEED_SIZE):
+        self.changes = deque(maxlen=size)
+        self.last_seq = 0
+        self.condition = threading.Condition()
+    
+    def extend(self, changes, last_seq):
+        """Agrega cambios ya guardados y despierta a los clientes en espera"""
+        with self.condition:
+            self.changes.extend(changes)
+            self.last_seq = max(self.last_seq, last_seq)
+            self.condition.notify_all()
+    
+    def changes_since(self, since, channel, limit):
+        """Cambios de un canal posteriores a since, o None si no están en memoria"""
+        with self.condition:
+            oldest = self.changes[0]['seq'] if self.changes else self.last_seq + 1
+            if since < oldest - 1:
+                return None
+            result = []
+            for change in self.changes:
+                if change['seq'] > since and change['channel'] == channel:
+                    result.append(change)
+                    if len(result) >= limit:
+                        break
+            return result
+    
+    def wait(self, since, timeout):
+        """Espera hasta que haya cambios posteriores a since (o timeout)"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.last_seq > since, timeout)
+
+# Rankings de tiempo visto (/api/leaderboard)
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', 100))  # K del top en memoria por canal y período
+LEADERBOARD_CACHE_SIZE = 64  # Tops de (canal, período) cargados en memoria
+LEADERBOARD_DEFAULT = 10
+
+# Suma una sesión cerrada a viewer_stats (watch_seconds y sessions son acumulativos)
+VIEWER_STATS_UPSERT = '''
+    INSERT INTO viewer_stats (channel, period, login, username, watch_seconds, sessions, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (channel, period, login) DO UPDATE SET
+        username = excluded.username,
+        watch_seconds = watch_seconds + excluded.watch_seconds,
+        sessions = sessions + excluded.sessions,
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+'''
+# Para el backfill de viewer_stats: recorre el historial de lo más reciente a
+# lo más antiguo, así que conserva el username que ya estaba guardado
+VIEWER_STATS_BACKFILL_UPSERT = VIEWER_STATS_UPSERT.replace(
+    'username = excluded.username', 'username = viewer_stats.username'
+)
+
+# Serie de tiempo de espectadores (/api/timeseries)
+TIMESERIES_RESOLUTIONS = {'raw': 0, 'minute': 60, 'hour': 3600, 'day': 86400}
+TIMESERIES_RETENTION = {  # Segundos que se conserva cada nivel (None: para siempre)
+    'raw': int(os.getenv('TIMESERIES_RAW_RETENTION', 2 * 86400)),
+    'minute': int(os.getenv('TIMESERIES_MINUTE_RETENTION', 14 * 86400)),
+    'hour': int(os.getenv('TIMESERIES_HOUR_RETENTION', 400 * 86400)),
+    'day': None
+}
+TIMESERIES_MAX_ROWS = 10000  # Filas leídas como máximo por consulta antes de reducir
+TIMESERIES_DEFAULT_POINTS = 500
+TIMESERIES_MAX_POINTS = 2000
+
+# Suma una muestra a un bucket de viewer_rollups
+VIEWER_ROLLUP_UPSERT = '''
+    INSERT INTO viewer_rollups (
+        channel, resolution, bucket, samples, chatters_sum, chatters_max,
+        viewers_samples, viewers_sum, viewers_max, joins, leaves
+    ) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (channel, resolution, bucket) DO UPDATE SET
+        samples = samples + 1,
+        chatters_sum = chatters_sum + excluded.chatters_sum,
+        chatters_max = MAX(chatters_max, excluded.chatters_max),
+        viewers_samples = viewers_samples + excluded.viewers_samples,
+        viewers_sum = viewers_sum + excluded.viewers_sum,
+        viewers_max = MAX(viewers_max, excluded.viewers_max),
+        joins = joins + excluded.joins,
+        leaves = leaves + excluded.leaves
+'''
+
+class Leaderboard:
+    """Top-K de tiempo visto de un canal en un período
+
+    Los totales de viewer_stats solo crecen, así que un usuario entra al top
+    únicamente cuando su total actualizado supera al último: basta comparar
+    cada salida con ese valor y leer el top cuesta O(K).
+    """
+    
+    def __init__(self, entries, size=LEADERBOARD_SIZE):
+        self.size = size
+        self.entries = entries[:size]  # Ordenadas por watch_seconds descendente
+    
+    def update(self, entry):
+        """Aplica el total actualizado de un usuario"""
+        entries = [current for current in self.entries if current['login'] != entry['login']]
+        if len(entries) >= self.size and entry['watch_seconds'] <= entries[-1]['watch_seconds']:
+            return
+        
+        position = 0
+        while position < len(entries) and entries[position]['watch_seconds'] >= entry['watch_seconds']:
+            position += 1
+        entries.insert(position, entry)
+        # Se reemplaza la lista completa para que las lecturas no necesiten lock
+        self.entries = entries[:self.size]
+    
+    def top(self, limit):
+        """Primeros `limit` usuarios del ranking"""
+        return self.entries[:limit]
+
+# Retención del historial: lo más antiguo se mueve a archivos comprimidos por mes
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', 365))  # 0 desactiva el archivado
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_BATCH_SIZE = 500  # Filas archivadas por transacción
+ARCHIVE_BATCH_PAUSE = 0.5  # Segundos entre lotes para ceder el escritor
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', 3600))  # Segundos entre pasadas
+ARCHIVE_FIELDS = ('id', 'channel', 'username', 'action', 'join_ts', 'leave_ts', 'duration_seconds', 'timestamp')
+ARCHIVE_FILE_PATTERN = re.compile(r'^(\d{4}-\d{2})\.ndjson\.gz$')
+ARCHIVE_INDEX_CACHE_SIZE = 6  # Índices de meses archivados en memoria
+
+class HistoryArchive:
+    """Historial archivado en archivos NDJSON con gzip, uno por canal y mes
+
+    Cada lote se agrega como un miembro gzip nuevo a <dir>/<canal>/<AAAA-MM>.ndjson.gz,
+    con sus filas en orden de (timestamp, id). Por cada lote se agrega una
+    línea a <AAAA-MM>.index.ndjson con su posición, su rango de (timestamp, id)
+    y sus usernames: las búsquedas y la paginación solo descomprimen los lotes
+    que pueden tener filas pedidas.
+
+    Si el proceso muere entre escribir un lote y borrarlo de SQLite, las filas
+    quedan en ambos lados: las lecturas descartan los ids repetidos. Un lote
+    escrito sin su línea de índice no se lee (sus filas siguen en SQLite).
+    """
+    
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.index_cache: Dict[tuple, Dict] = {}  # (canal, mes) -> índice leído hasta 'size'
+    
+    def path(self, channel, month):
+        return os.path.join(self.directory, channel, f'{month}.ndjson.gz')
+    
+    def index_path(self, channel, month):
+        return os.path.join(self.directory, channel, f'{month}.index.ndjson')
+    
+    def append(self, channel, month, rows):
+        """Agrega filas de user_history (en el orden de ARCHIVE_FIELDS) y las lleva a disco"""
+        path = self.path(channel, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            if os.path.exists(path) and not os.path.exists(self.index_path(channel, month)):
+                self._rebuild_index(channel, month)
+            
+            with open(path, 'ab') as raw:
+                raw.seek(0, os.SEEK_END)
+                offset = raw.tell()
+                with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                    for row in rows:
+                        line = json.dumps(dict(zip(ARCHIVE_FIELDS, row)), ensure_ascii=False)
+                        archive.write(line.encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+                length = raw.tell() - offset
+            
+            keys = [(row[7], row[0]) for row in rows]
+            self._append_index(channel, month, [{
+                'offset': offset,
+                'length': length,
+                'first': min(keys),
+                'last': max(keys),
+                'users': sorted({row[2] for row in rows})
+            }])
+    
+    def _append_index(self, channel, month, entries):
+        """Agrega líneas al índice del mes (debe llamarse con self.lock tomado)"""
+        path = self.index_path(channel, month)
+        with open(path, 'a+b') as index:
+            # Una línea cortada por una caída se descarta antes de seguir escribiendo
+            size = index.seek(0, os.SEEK_END)
+            if size:
+                index.seek(max(0, size - 65536))
+                tail = index.read()
+                if not tail.endswith(b'\n'):
+                    index.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+            for entry in entries:
+                index.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+            index.flush()
+            os.fsync(index.fileno())
+    
+    def _rebuild_index(self, channel, month):
+        """Reconstruye el índice recorriendo los miembros gzip del mes (debe llamarse con self.lock tomado)"""
+        entries = []
+        with open(self.path(channel, month), 'rb') as raw:
+            start = consumed = 0
+            pending = b''
+            decompressor = zlib.decompressobj(31)
+            text = []
+            while True:
+                chunk = pending or raw.read(1 << 16)
+                pending = b''
+                if not chunk:
+                    break
+                text.append(decompressor.decompress(chunk))
+                if not decompressor.eof:
+                    consumed += len(chunk)
+                    continue
+                
+                end = consumed + len(chunk) - len(decompressor.unused_data)
+                rows = [json.loads(line) for line in b''.join(text).splitlines()]
+                if rows:
+                    keys = [(row['timestamp'], row['id']) for row in rows]
+                    entries.append({
+                        'offset': start,
+                        'length': end - start,
+                        'first': min(keys),
+                        'last': max(keys),
+                        'users': sorted({row['username'] for row in rows})
+                    })
+                pending = decompressor.unused_data
+                start = consumed = end
+                decompressor = zlib.decompressobj(31)
+                text = []
+        
+        path = self.index_path(channel, month)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as index:
+            for entry in entries:
+                index.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+        os.replace(temp_path, path)
+        self.index_cache.pop((channel, month), None)
+    
+    def index(self, channel, month):
+        """Índice de un mes: lotes (offset, length, primera clave, última clave) y username -> lotes
+
+        Se leen solo las líneas agregadas desde la última consulta.
+        """
+        key = (channel, month)
+        path = self.index_path(channel, month)
+        with self.lock:
+            if not os.path.exists(path):
+                if not os.path.exists(self.path(channel, month)):
+                    return None
+                self._rebuild_index(channel, month)
+            
+            index = self.index_cache.pop(key, None) or {'size': 0, 'members': [], 'users': {}}
+            self.index_cache[key] = index
+            if len(self.index_cache) > ARCHIVE_INDEX_CACHE_SIZE:
+                self.index_cache.pop(next(iter(self.index_cache)))
+            
+            size = os.path.getsize(path)
+            if size > index['size']:
+                with open(path, 'rb') as source:
+                    source.seek(index['size'])
+                    data = source.read(size - index['size'])
+                data = data[:data.rfind(b'\n') + 1]
+                for line in data.splitlines():
+                    entry = json.loads(line)
+                    number = len(index['members'])
+                    index['members'].append(
+                        (entry['offset'], entry['length'], tuple(entry['first']), tuple(entry['last']))
+                    )
+                    for username in entry['users']:
+                        index['users'].setdefault(username.casefold(), []).append(number)
+                index['size'] += len(data)
+            return index
+    
+    def months(self, channel, since=None, until=None):
+        """Meses archivados de un canal que se cruzan con [since, until), del más antiguo al más reciente"""
+        try:
+            names = os.listdir(os.path.join(self.directory, channel))
+        except FileNotFoundError:
+            return []
+        
+        first = archive_month(since) if since is not None else None
+        last = archive_month(until - 1) if until is not None else None
+        months = []
+        for name in names:
+            match = ARCHIVE_FILE_PATTERN.match(name)
+            if match and (first is None or match.group(1) >= first) and (last is None or match.group(1) <= last):
+                months.append(match.group(1))
+        return sorted(months)
+    
+    def members(self, channel, month, username=None, match='contains', since=None, until=None, before=None):
+        """Lotes de un mes que pueden tener filas del rango pedido
+
+        username/match: filtro como en username_filter_clause. before: clave
+        (timestamp, id) del cursor; solo interesan filas anteriores a ella.
+        """
+        index = self.index(channel, month)
+        if index is None:
+            return []
+        
+        members = index['members']
+        users = index['users']  # Claves en casefold
+        if not username:
+            numbers = range(len(members))
+        elif match == 'exact':
+            numbers = users.get(username.casefold(), [])
+        else:
+            wanted = username.casefold()
+            if match == 'prefix':
+                found = [user_members for key, user_members in users.items() if key.startswith(wanted)]
+            else:
+                found = [user_members for key, user_members in users.items() if wanted in key]
+            numbers = sorted({number for user_members in found for number in user_members})
+        
+        selected = []
+        for number in numbers:
+            member = members[number]
+            if since is not None and member[3][0] < since:
+                continue
+            if until is not None and member[2][0] >= until:
+                continue
+            if before is not None and member[2] >= before:
+                continue
+            selected.append(member)
+        return selected
+    
+    def read_member(self, channel, month, member):
+        """Filas de un lote como tuplas de historial (id, username, action, join_ts, leave_ts, duration_seconds, timestamp)"""
+        offset, length = member[0], member[1]
+        try:
+            with open(self.path(channel, month), 'rb') as raw:
+                raw.seek(offset)
+                data = zlib.decompress(raw.read(length), 31)
+        except (OSError, zlib.error) as e:
+            print(f"⚠️ Lote de historial ilegible {channel}/{month}@{offset}: {e}")
+            return
+        
+        for line in data.splitlines():
+            row = json.loads(line)
+            yield (row['id'], row['username'], row['action'], row['join_ts'],
+                   row['leave_ts'], row['duration_seconds'], row['timestamp'])
+
+# Exportación del historial (/api/export)
+EXPORT_FETCH_SIZE = 1000  # Filas por fetchmany y por bloque de la respuesta
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', 2))  # Cada exportación ocupa una conexión de lectura
+EXPORT_COLUMNS = (
+    'id', 'username', 'action', 'join_time', 'leave_time', 'duration', 'date_created',
+    'timestamp', 'join_ts', 'leave_ts', 'duration_seconds'
+)
+
 # Clase para manejar la base de datos
 class DatabaseManager:
+    # Versión del esquema guardada en PRAGMA user_version
+    SCHEMA_VERSION = 13
+    # Filas del historial legado migradas por transacción
+    MIGRATION_BATCH_SIZE = 500
+    
     def __init__(self, db_path='tracker_history.db'):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.migration_running = False
+        self.stats_backfill_running = False
+        self.fts_enabled = False
+        self.changes = ChangeFeed()
+        self.change_seq = 0
+        self.change_lock = threading.Lock()
+        self.leaderboards: Dict[tuple, Leaderboard] = {}  # (canal, período) -> top-K
+        self.samples_pruned_at = 0  # Hora (epoch // 3600) de la última poda de la serie de tiempo
+        self.archive = HistoryArchive()
         self.init_database()
+        self.load_change_feed()
     
     def init_database(self):
-        """Inicializa la base de datos y crea las tablas necesarias"""
+        """Inicializa la base de datos y aplica las migraciones pendientes"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.transaction() as conn:
                 cursor = conn.cursor()
+                version = cursor.execute('PRAGMA user_version').fetchone()[0]
                 
-                # Tabla para historial de usuarios
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_history (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT NOT NULL,
-                        action TEXT NOT NULL,
-                        join_time TEXT,
-                        leave_time TEXT,
-                        duration TEXT,
-                        date_created TEXT NOT NULL,
-                        timestamp INTEGER NOT NULL
-                    )
-                ''')
+                if version < 1:
+                    self._migrate_v1(cursor)
+                if version < 2:
+                    self._migrate_v2(cursor)
+                if version < 3:
+                    self._migrate_v3(cursor)
+                if version < 4:
+                    self._migrate_v4(cursor)
+                if version < 5:
+                    self._migrate_v5(cursor)
+                if version < 6:
+                    self._migrate_v6(cursor)
+                if version < 7:
+                    self._migrate_v7(cursor)
+                if version < 8:
+                    self._migrate_v8(cursor)
+                if version < 9:
+                    self._migrate_v9(cursor)
+                if version < 10:
+                    self._migrate_v10(cursor)
+                if version < 11:
+                    self._migrate_v11(cursor)
+                if version < 12:
+                    self._migrate_v12(cursor)
+                if version < 13:
+                    self._migrate_v13(cursor)
                 
-                # Tabla para usuarios actuales
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS current_users (
-                        username TEXT PRIMARY KEY,
-                        join_time TEXT NOT NULL,
-                        last_seen INTEGER NOT NULL
-                    )
-                ''')
+                if version < self.SCHEMA_VERSION:
+                    cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+                    # Estadísticas nuevas para que el planner elija los índices recreados
+                    cursor.execute('ANALYZE')
+                
+                self.fts_enabled = cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'username_search'"
+                ).fetchone() is not None
                 
-                conn.commit()
-                print("✅ Base de datos inicializada correctamente")
+            print("✅ Base de datos inicializada correctamente")
                 
         except Exception as e:
             print(f"❌ Error inicializando base de datos: {e}")
     
-    def add_user_entry(self, username, action, join_time=None, leave_time=None, duration=None):
-        """Agrega una entrada al historial"""
+    def _migrate_v1(self, cursor):
+        """Esquema original con fechas y duraciones como texto"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                action TEXT NOT NULL,
+                join_time TEXT,
+                leave_time TEXT,
+                duration TEXT,
+                date_created TEXT NOT NULL,
+                timestamp INTEGER NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS current_users (
+                username TEXT PRIMARY KEY,
+                join_time TEXT NOT NULL,
+                last_seen INTEGER NOT NULL
+            )
+        ''')
+    
+    def _migrate_v2(self, cursor):
+        """Esquema con epochs enteros e índices
+
+        El historial legado se renombra a user_history_v1 y se copia en lotes
+        desde un hilo en segundo plano (ver _backfill_legacy_history).
+        """
+        cursor.execute('ALTER TABLE user_history RENAME TO user_history_v1')
+        cursor.execute('''
+            CREATE TABLE user_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                action TEXT NOT NULL,
+                join_ts INTEGER,
+                leave_ts INTEGER,
+                duration_seconds INTEGER,
+                timestamp INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX idx_user_history_username_ts ON user_history (username, timestamp)')
+        cursor.execute('CREATE INDEX idx_user_history_ts ON user_history (timestamp)')
+        
+        # Las filas nuevas no deben reutilizar ids que aún están por migrar
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM user_history_v1), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'user_history_v1'), 0))
+        ''')
+        last_id = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'user_history'")
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('user_history', ?)", (last_id,))
+        
+        # current_users es pequeña: se convierte de inmediato
+        cursor.execute('ALTER TABLE current_users RENAME TO current_users_v1')
+        cursor.execute('''
+            CREATE TABLE current_users (
+                username TEXT PRIMARY KEY,
+                join_ts INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL
+            )
+        ''')
+        rows = cursor.execute('SELECT username, join_time, last_seen FROM current_users_v1').fetchall()
+        cursor.executemany(
+            'INSERT INTO current_users (username, join_ts, last_seen) VALUES (?, ?, ?)',
+            [(username, parse_santiago_time(join_time) or last_seen, last_seen) for username, join_time, last_seen in rows]
+        )
+        cursor.execute('DROP TABLE current_users_v1')
+    
+    def _migrate_v3(self, cursor):
+        """Diccionario de usernames con índice trigram para búsquedas por substring
+
+        Un trigger en user_history mantiene el diccionario (y el índice FTS5)
+        dentro de la misma transacción de cada inserción.
+        """
+        cursor.execute('''
+            CREATE TABLE usernames (
+                id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL UNIQUE
+            )
+        ''')
+        cursor.execute('CREATE INDEX idx_usernames_nocase ON usernames (username COLLATE NOCASE)')
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                timestamp = int(time.time())
-                date_created = datetime.now(SANTIAGO_TZ).strftime('%d-%m-%y %H:%M:%S')
-                
-                cursor.execute('''
-                    INSERT INTO user_history (username, action, join_time, leave_time, duration, date_created, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (username, action, join_time, leave_time, duration, date_created, timestamp))
+            cursor.execute('''
+                CREATE VIRTUAL TABLE username_search USING fts5(
+                    username, content='usernames', content_rowid='id', tokenize='trigram'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER usernames_search_insert AFTER INSERT ON usernames BEGIN
+                    INSERT INTO username_search (rowid, username) VALUES (new.id, new.username);
+                END
+            ''')
+        except sqlite3.OperationalError as e:
+            # SQLite sin FTS5/trigram: las búsquedas por substring usan LIKE sobre usernames
+            print(f"⚠️ FTS5 trigram no disponible, usando búsqueda sin índice: {e}")
+        
+        cursor.execute('''
+            CREATE TRIGGER user_history_register_username AFTER INSERT ON user_history BEGIN
+                INSERT OR IGNORE INTO usernames (username) VALUES (new.username);
+            END
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO usernames (username) SELECT DISTINCT username FROM user_history')
+    
+    def _migrate_v4(self, cursor):
+        """Caché persistente de IDs de canal (login -> broadcaster_id)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_ids (
+                login TEXT PRIMARY KEY,
+                broadcaster_id TEXT NOT NULL,
+                resolved_at INTEGER NOT NULL
+            )
+        ''')
+    
+    def _migrate_v5(self, cursor):
+        """Clave de canal en historial y usuarios actuales (tracking multi-canal)
+
+        Las filas existentes pertenecen al canal que se trackeaba antes.
+        """
+        cursor.execute(f"ALTER TABLE user_history ADD COLUMN channel TEXT NOT NULL DEFAULT '{LEGACY_CHANNEL}'")
+        cursor.execute('DROP INDEX IF EXISTS idx_user_history_username_ts')
+        cursor.execute('DROP INDEX IF EXISTS idx_user_history_ts')
+        cursor.execute('CREATE INDEX idx_user_history_channel_username_ts ON user_history (channel, username, timestamp)')
+        cursor.execute('CREATE INDEX idx_user_history_channel_ts ON user_history (channel, timestamp)')
+        
+        cursor.execute('ALTER TABLE current_users RENAME TO current_users_v2')
+        cursor.execute('''
+            CREATE TABLE current_users (
+                channel TEXT NOT NULL,
+                username TEXT NOT NULL,
+                join_ts INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL,
+                PRIMARY KEY (channel, username)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO current_users (channel, username, join_ts, last_seen)
+            SELECT ?, username, join_ts, last_seen FROM current_users_v2
+        ''', (LEGACY_CHANNEL,))
+        cursor.execute('DROP TABLE current_users_v2')
+    
+    def _migrate_v6(self, cursor):
+        """Log de entradas y salidas con secuencia para /api/changes"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY,
+                channel TEXT NOT NULL,
+                event TEXT NOT NULL,
+                login TEXT NOT NULL,
+                username TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                duration_seconds INTEGER
+            )
+        ''')
+    
+    def _migrate_v7(self, cursor):
+        """Nombre visible de los usuarios actuales, para restaurar sesiones al reiniciar"""
+        cursor.execute('ALTER TABLE current_users ADD COLUMN display_name TEXT')
+    
+    def _migrate_v8(self, cursor):
+        """Estado publicado por el proceso que hace polling para los demás workers"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tracker_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+    
+    def _migrate_v9(self, cursor):
+        """Acumulados de tiempo visto por usuario y período, calculados desde el historial
+
+        Períodos: 'all', mes ('2026-10'), semana ISO ('2026-W42') y día
+        ('2026-10-17') en hora de Santiago, según la hora de salida.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS viewer_stats (
+                channel TEXT NOT NULL,
+                period TEXT NOT NULL,
+                login TEXT NOT NULL,
+                username TEXT NOT NULL,
+                watch_seconds INTEGER NOT NULL,
+                sessions INTEGER NOT NULL,
+                first_seen INTEGER,
+                last_seen INTEGER,
+                PRIMARY KEY (channel, period, login)
+            )
+        ''')
+        cursor.execute('CREATE INDEX idx_viewer_stats_rank ON viewer_stats (channel, period, watch_seconds DESC)')
+        
+        # Las filas ya existentes se suman en lotes desde un hilo en segundo
+        # plano (ver _backfill_viewer_stats); aquí solo se anotan sus ids, así
+        # las salidas nuevas y las del historial legado no se cuentan dos veces
+        cursor.execute('CREATE TABLE viewer_stats_backfill (id INTEGER PRIMARY KEY)')
+        cursor.execute('''
+            INSERT INTO viewer_stats_backfill (id)
+            SELECT id FROM user_history WHERE duration_seconds IS NOT NULL
+        ''')
+    
+    def _migrate_v10(self, cursor):
+        """Serie de tiempo de espectadores: una muestra por poll y buckets por minuto, hora y día"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS viewer_samples (
+                channel TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                chatters INTEGER NOT NULL,
+                viewer_count INTEGER,
+                joins INTEGER NOT NULL,
+                leaves INTEGER NOT NULL,
+                PRIMARY KEY (channel, ts)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS viewer_rollups (
+                channel TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                chatters_sum INTEGER NOT NULL,
+                chatters_max INTEGER NOT NULL,
+                viewers_samples INTEGER NOT NULL,
+                viewers_sum INTEGER NOT NULL,
+                viewers_max INTEGER NOT NULL,
+                joins INTEGER NOT NULL,
+                leaves INTEGER NOT NULL,
+                PRIMARY KEY (channel, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _migrate_v11(self, cursor):
+        """Logs publicados por el líder, uno por fila: los workers leen solo los nuevos"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tracker_logs (
+                id INTEGER PRIMARY KEY,
+                record TEXT NOT NULL
+            )
+        ''')
+    
+    def _migrate_v12(self, cursor):
+        """Usuarios actuales anteriores a v7: login en minúsculas y nombre visible aparte
+
+        Antes de v7 la clave de current_users era el nombre visible y no había
+        checkpoints (last_seen es la hora de entrada). Las filas que nunca
+        tuvieron un checkpoint se descartan: cerrarlas inventaría la duración.
+        """
+        cursor.execute('DELETE FROM current_users WHERE display_name IS NULL AND last_seen - join_ts <= 1')
+        rows = cursor.execute('SELECT channel, username FROM current_users WHERE display_name IS NULL').fetchall()
+        cursor.executemany(
+            'UPDATE OR IGNORE current_users SET username = ?, display_name = ? WHERE channel = ? AND username = ?',
+            [(username.lower(), username, channel, username) for channel, username in rows]
+        )
+        # Dos nombres visibles con el mismo login: se queda la fila que ya lo tenía
+        cursor.execute('DELETE FROM current_users WHERE display_name IS NULL')
+    
+    def _migrate_v13(self, cursor):
+        """Índices por tiempo para la poda horaria de la serie de tiempo
+
+        La clave primaria empieza por el canal: sin estos índices cada poda
+        (que abarca todos los canales) recorre la tabla completa.
+        """
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_viewer_samples_ts ON viewer_samples (ts)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_viewer_rollups_resolution_bucket ON viewer_rollups (resolution, bucket)')
+    
+    def _update_viewer_stats(self, cursor, channel, leaves, upsert=VIEWER_STATS_UPSERT):
+        """Suma las sesiones cerradas a viewer_stats dentro de la transacción en curso
+
+        leaves: tuplas (login, username, action, join_ts, leave_ts, duration_seconds)
+        Devuelve los totales actualizados como tuplas (canal, período, entrada).
+        """
+        updated = []
+        for login, username, _, join_ts, leave_ts, duration_seconds in leaves:
+            if duration_seconds is None or leave_ts is None:
+                continue
+            for period in stats_periods(leave_ts):
+                username, watch_seconds, sessions, first_seen, last_seen = cursor.execute(
+                    upsert + ' RETURNING username, watch_seconds, sessions, first_seen, last_seen',
+                    (channel, period, login, username, duration_seconds, 1, join_ts or leave_ts, leave_ts)
+                ).fetchone()
+                updated.append((channel, period, {
+                    'login': login,
+                    'username': username,
+                    'watch_seconds': watch_seconds,
+                    'sessions': sessions,
+                    'first_seen': first_seen,
+                    'last_seen': last_seen
+                }))
+        return updated
+    
+    def get_leaderboard(self, channel, period, limit=LEADERBOARD_DEFAULT):
+        """Usuarios con más tiempo visto de un canal en un período
+
+        El top-K se carga una vez con el índice de viewer_stats y luego se
+        mantiene con cada salida; cada lectura cuesta O(K).
+        """
+        limit = max(1, min(int(limit), LEADERBOARD_SIZE))
+        key = (channel, period)
+        try:
+            with self.change_lock:
+                board = self.leaderboards.get(key)
+                if board is None:
+                    with self.pool.reader() as conn:
+                        rows = conn.execute('''
+                            SELECT login, username, watch_seconds, sessions, first_seen, last_seen
+                            FROM viewer_stats WHERE channel = ? AND period = ?
+                            ORDER BY watch_seconds DESC LIMIT ?
+                        ''', (channel, period, LEADERBOARD_SIZE)).fetchall()
+                    
+                    board = Leaderboard([{
+                        'login': login,
+                        'username': username,
+                        'watch_seconds': watch_seconds,
+                        'sessions': sessions,
+                        'first_seen': first_seen,
+                        'last_seen': last_seen
+                    } for login, username, watch_seconds, sessions, first_seen, last_seen in rows])
+                    
+                    if len(self.leaderboards) >= LEADERBOARD_CACHE_SIZE:
+                        # Descartar el top cargado hace más tiempo
+                        self.leaderboards.pop(next(iter(self.leaderboards)))
+                    self.leaderboards[key] = board
+            
+            return board.top(limit)
+            
+        except Exception as e:
+            print(f"❌ Error obteniendo ranking: {e}")
+            return []
+    
+    def record_viewer_sample(self, channel, ts, chatters, viewer_count, joins, leaves):
+        """Guarda la muestra de un poll y la suma a los buckets de minuto, hora y día
+
+        Una vez por hora poda cada nivel según TIMESERIES_RETENTION.
+        """
+        ts = int(ts)
+        has_viewers = viewer_count is not None
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO viewer_samples (channel, ts, chatters, viewer_count, joins, leaves)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (channel, ts, chatters, viewer_count, joins, leaves))
+                conn.executemany(VIEWER_ROLLUP_UPSERT, [
+                    (channel, resolution, bucket, chatters, chatters,
+                     int(has_viewers), viewer_count or 0, viewer_count or 0, joins, leaves)
+                    for resolution, bucket in rollup_buckets(ts)
+                ])
                 
-                conn.commit()
+                if ts // 3600 != self.samples_pruned_at:
+                    self.samples_pruned_at = ts // 3600
+                    conn.execute('DELETE FROM viewer_samples WHERE ts < ?', (ts - TIMESERIES_RETENTION['raw'],))
+                    for resolution in ('minute', 'hour'):
+                        conn.execute(
+                            'DELETE FROM viewer_rollups WHERE resolution = ? AND bucket < ?',
+                            (resolution, ts - TIMESERIES_RETENTION[resolution])
+                        )
                 return True
                 
         except Exception as e:
-            print(f"❌ Error agregando entrada: {e}")
+            print(f"❌ Error guardando muestra de espectadores: {e}")
             return False
     
-    def get_user_history(self, username=None, date_filter=None, limit=100):
-        """Obtiene el historial con filtros opcionales"""
+    def get_viewer_series(self, channel, resolution, since, until):
+        """Puntos de la serie de tiempo de un canal en [since, until), del más antiguo al más reciente
+
+        Con resolution='raw' son las muestras de cada poll; con los demás
+        niveles, un punto por bucket con promedios y máximos.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                query = "SELECT * FROM user_history WHERE 1=1"
-                params = []
-                
-                if username:
-                    query += " AND username LIKE ?"
-                    params.append(f"%{username}%")
-                
-                if date_filter:
-                    query += " AND date_created LIKE ?"
-                    params.append(f"%{date_filter}%")
-                
-                query += " ORDER BY timestamp DESC LIMIT ?"
-                params.append(limit)
-                
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-                
-                # Convertir a lista de diccionarios
-                history = []
-                for row in results:
-                    history.append({
-                        'id': row[0],
-                        'username': row[1],
-                        'action': row[2],
-                        'join_time': row[3],
-                        'leave_time': row[4],
-                        'duration': row[5],
-                        'date_created': row[6],
-                        'timestamp': row[7]
-                    })
-                
-                return history
-                
+            with self.pool.reader() as conn:
+                if resolution == 'raw':
+                    rows = conn.execute('''
+                        SELECT ts, chatters, chatters, viewer_count, viewer_count, joins, leaves
+                        FROM viewer_samples WHERE channel = ? AND ts >= ? AND ts < ?
+                        ORDER BY ts LIMIT ?
+                    ''', (channel, since, until, TIMESERIES_MAX_ROWS)).fetchall()
+                else:
+                    rows = conn.execute('''
+                        SELECT bucket, CAST(chatters_sum AS REAL) / samples, chatters_max,
+                               CASE WHEN viewers_samples > 0 THEN CAST(viewers_sum AS REAL) / viewers_samples END,
+                               CASE WHEN viewers_samples > 0 THEN viewers_max END,
+                               joins, leaves
+                        FROM viewer_rollups WHERE channel = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+                        ORDER BY bucket LIMIT ?
+                    ''', (channel, resolution, since, until, TIMESERIES_MAX_ROWS)).fetchall()
+            
+            return [{
+                'ts': ts,
+                'chatters': round(chatters, 1),
+                'chatters_max': chatters_max,
+                'viewer_count': round(viewer_count, 1) if viewer_count is not None else None,
+                'viewer_count_max': viewer_count_max,
+                'joins': joins,
+                'leaves': leaves
+            } for ts, chatters, chatters_max, viewer_count, viewer_count_max, joins, leaves in rows]
+            
         except Exception as e:
-            print(f"❌ Error obteniendo historial: {e}")
+            print(f"❌ Error obteniendo serie de espectadores: {e}")
             return []
     
-    def update_current_user(self, username, join_time):
-        """Actualiza o agrega un usuario actual"""
+    def invalidate_leaderboards(self):
+        """Descarta los tops en memoria (cuando otro proceso escribió viewer_stats)"""
+        with self.change_lock:
+            self.leaderboards.clear()
+    
+    def load_change_feed(self):
+        """Carga en memoria los últimos cambios guardados"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                timestamp = int(time.time())
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO current_users (username, join_time, last_seen)
-                    VALUES (?, ?, ?)
-                ''', (username, join_time, timestamp))
-                
-                conn.commit()
-                return True
-                
+            with self.pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT seq, channel, event, login, username, ts, duration_seconds
+                    FROM change_log ORDER BY seq DESC LIMIT ?
+                ''', (CHANGE_FEED_SIZE,)).fetchall()
+            
+            rows.reverse()
+            self.change_seq = rows[-1][0] if rows else 0
+            self.changes.extend([format_change_row(row) for row in rows], self.change_seq)
+            
         except Exception as e:
-            print(f"❌ Error actualizando usuario actual: {e}")
-        return False
+            print(f"❌ Error cargando feed de cambios: {e}")
     
-    def remove_current_user(self, username):
-        """Remueve un usuario de la lista actual"""
+    def get_changes_after(self, seq, limit=CHANGES_MAX_PAGE_SIZE):
+        """Cambios de todos los canales posteriores a seq, ya formateados"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('DELETE FROM current_users WHERE username = ?', (username,))
-                conn.commit()
+            with self.pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT seq, channel, event, login, username, ts, duration_seconds
+                    FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?
+                ''', (seq, limit)).fetchall()
+            return [format_change_row(row) for row in rows]
+            
+        except Exception as e:
+            print(f"❌ Error leyendo cambios: {e}")
+            return []
+    
+    def get_replica_snapshot(self):
+        """Usuarios actuales de todos los canales y la secuencia a la que corresponden
+
+        Se leen en una sola transacción de lectura para que sean consistentes.
+        """
+        with self.pool.reader() as conn:
+            conn.execute('BEGIN')
+            try:
+                rows = conn.execute(
+                    'SELECT channel, username, display_name, join_ts, last_seen FROM current_users'
+                ).fetchall()
+                seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+            finally:
+                conn.execute('COMMIT')
+        
+        users: Dict[str, List[Dict]] = {}
+        for channel, login, display_name, join_ts, last_seen in rows:
+            users.setdefault(channel, []).append({
+                'login': login,
+                'username': display_name or login,
+                'join_time': format_santiago_time(join_ts),
+                'join_ts': join_ts,
+                'last_seen': last_seen
+            })
+        return users, seq
+    
+    def sync_change_seq(self):
+        """Retoma la secuencia de change_log (al pasar a ser el proceso que escribe)"""
+        with self.change_lock:
+            with self.pool.reader() as conn:
+                self.change_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    
+    def save_tracker_state(self, key, value):
+        """Publica un valor JSON en tracker_state"""
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO tracker_state (key, value, updated_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False), int(time.time()))
+                )
                 return True
                 
         except Exception as e:
-            print(f"❌ Error removiendo usuario actual: {e}")
+            print(f"❌ Error publicando estado del tracker: {e}")
             return False
     
-    def get_current_users(self):
-        """Obtiene la lista de usuarios actuales"""
+    def get_tracker_state(self, key):
+        """Lee (valor, updated_at) de tracker_state o None"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT username, join_time, last_seen FROM current_users ORDER BY last_seen DESC')
-                results = cursor.fetchall()
-                
-                users = []
-                for row in results:
-                    users.append({
-                        'username': row[0],
-                        'join_time': row[1],
-                        'last_seen': row[2]
-                    })
-                
-                return users
-                
+            with self.pool.reader() as conn:
+                row = conn.execute('SELECT value, updated_at FROM tracker_state WHERE key = ?', (key,)).fetchone()
+            return (json.loads(row[0]), row[1]) if row else None
+            
         except Exception as e:
-            print(f"❌ Error obteniendo usuarios actuales: {e}")
-        return []
-    
-class TwitchTracker:
-    def __init__(self):
-        self.channel_name = 'blackcraneo'
-        self.oauth_token = os.getenv('TWITCH_OAUTH', '')
-        self.running = False
-        self.logs = []
-        self.max_logs = 50
-        
-        # Base de datos
-        self.db = DatabaseManager()
-        
-        # Estado de usuarios
-        self.previous_users = set()  # Usuarios del ciclo anterior
-        self.current_users = set()   # Usuarios del ciclo actual
-        self.user_join_times = {}    # Tiempo de entrada de cada usuario
-        self.user_last_seen = {}     # Última vez que se vio a cada usuario
-        
-        # Configuración de polling
-        self.poll_interval = 10      # Polling cada 10 segundos (más responsivo)
-        self.client_id = 'gp762nuuoqcoxypju8c569th9wz7q5'  # Client ID público
-        self.rate_limit_remaining = 800  # Límite de requests por minuto
-        self.last_rate_limit_reset = time.time()
-        
-        # Estadísticas
-        self.total_polls = 0
-        self.successful_polls = 0
-        self.last_poll_time = 0
+            print(f"❌ Error leyendo estado del tracker: {e}")
+            return None
     
-    def add_log(self, message):
-        """Agrega un mensaje al log"""
-        timestamp = get_santiago_time()
-        log_entry = f"[{timestamp}] {message}"
-        self.logs.append(log_entry)
-        
-        # Mantener solo los últimos logs
-        if len(self.logs) > self.max_logs:
-            self.logs.pop(0)
-        
-        # Imprimir en consola sin emojis para evitar problemas de codificación
+    def append_tracker_logs(self, records):
+        """Publica registros de log nuevos y conserva solo los últimos LOG_BUFFER_SIZE"""
         try:
-            print(log_entry)
-        except UnicodeEncodeError:
-            # Si hay problemas con emojis, imprimir sin ellos
-            clean_message = ''.join(char for char in message if ord(char) < 128)
-            clean_entry = f"[{timestamp}] {clean_message}"
-            print(clean_entry)
+            with self.pool.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO tracker_logs (record) VALUES (?)',
+                    [(json.dumps(record, ensure_ascii=False),) for record in records]
+                )
+                conn.execute(
+                    'DELETE FROM tracker_logs WHERE id <= (SELECT MAX(id) FROM tracker_logs) - ?',
+                    (LOG_BUFFER_SIZE,)
+                )
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error publicando logs del tracker: {e}")
+            return False
     
-    def get_api_headers(self):
-        """Obtiene headers para requests a la API de Twitch"""
-        return {
-            'Authorization': f'Bearer {self.oauth_token.replace("oauth:", "")}',
-            'Client-Id': self.client_id
-        }
+    def get_tracker_logs_after(self, last_id):
+        """Registros de log publicados después de last_id, como tuplas (id, registro)"""
+        try:
+            with self.pool.reader() as conn:
+                rows = conn.execute(
+                    'SELECT id, record FROM tracker_logs WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+            return [(row_id, json.loads(record)) for row_id, record in rows]
+            
+        except Exception as e:
+            print(f"❌ Error leyendo logs del tracker: {e}")
+            return []
     
-    def check_rate_limit(self):
-        """Verifica y actualiza rate limiting"""
-        current_time = time.time()
+    def get_changes_since(self, channel, since, limit):
+        """Cambios de un canal posteriores a since
+
+        Devuelve (cambios, resync): resync es True si since es anterior a lo
+        que se conserva y el cliente debe volver a cargar el estado completo.
+        """
+        if since > self.changes.last_seq:
+            # Secuencia de otra base de datos (por ejemplo tras restaurar un respaldo)
+            return [], True
         
-        # Reset rate limit cada minuto
-        if current_time - self.last_rate_limit_reset >= 60:
-            self.rate_limit_remaining = 800
-            self.last_rate_limit_reset = current_time
+        changes = self.changes.changes_since(since, channel, limit)
+        if changes is not None:
+            return changes, False
         
-        return self.rate_limit_remaining > 0
-    
-    def get_chatters_from_api(self):
-        """Obtiene lista de chatters usando la API de Twitch"""
         try:
-            if not self.check_rate_limit():
-                self.add_log('⚠️ Rate limit alcanzado, esperando...')
-                return set()
-            
-            headers = self.get_api_headers()
-            
-            # Obtener ID del canal
-            user_response = requests.get(
-                f'https://api.twitch.tv/helix/users?login={self.channel_name}',
-                headers=headers,
-                timeout=10
-            )
-            
-            if user_response.status_code != 200:
-                self.add_log(f'❌ Error obteniendo ID del canal: {user_response.status_code}')
-                return set()
-            
-            user_data = user_response.json()
-            if not user_data.get('data'):
-                self.add_log('❌ Canal no encontrado')
-                return set()
-            
-            channel_id = user_data['data'][0]['id']
-            self.rate_limit_remaining -= 1
-            
-            # Obtener chatters
-            chatters_response = requests.get(
-                f'https://api.twitch.tv/helix/chat/chatters?broadcaster_id={channel_id}&moderator_id={channel_id}',
-                headers=headers,
-                timeout=10
-            )
-            
-            if chatters_response.status_code == 200:
-                chatters_data = chatters_response.json()
-                chatters = set()
+            with self.pool.reader() as conn:
+                oldest = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+                if oldest is None or since < oldest - 1:
+                    return [], True
                 
-                for chatter in chatters_data.get('data', []):
-                    username = chatter.get('user_name', '')
-                    if username and username.lower() not in [bot.lower() for bot in EXCLUDED_BOTS]:
-                        chatters.add(username)
-                
-                self.rate_limit_remaining -= 1
-                self.add_log(f'📊 API: {len(chatters)} chatters detectados - Poll #{self.total_polls}')
-                return chatters
-                
-            elif chatters_response.status_code == 403:
-                self.add_log('⚠️ Sin permisos de moderador - usando información del stream')
-                return self.get_stream_viewers_fallback()
-            else:
-                self.add_log(f'❌ Error obteniendo chatters: {chatters_response.status_code}')
-                return set()
+                rows = conn.execute('''
+                    SELECT seq, channel, event, login, username, ts, duration_seconds
+                    FROM change_log WHERE seq > ? AND channel = ? ORDER BY seq LIMIT ?
+                ''', (since, channel, limit)).fetchall()
+                return [format_change_row(row) for row in rows], False
                 
         except Exception as e:
-            self.add_log(f'❌ Error en get_chatters_from_api: {e}')
-            return set()
+            print(f"❌ Error obteniendo cambios: {e}")
+            return [], False
     
-    def get_stream_viewers_fallback(self):
-        """Fallback cuando no hay permisos de moderador"""
+    def start_background_migration(self):
+        """Inicia la copia en lotes del historial legado y el backfill de viewer_stats si queda algo pendiente"""
         try:
-            headers = self.get_api_headers()
+            with self.pool.reader() as conn:
+                pending = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_history_v1'"
+                ).fetchone()
             
-            response = requests.get(
-                f'https://api.twitch.tv/helix/streams?user_login={self.channel_name}',
-                headers=headers,
-                timeout=10
-            )
+                stats_pending = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'viewer_stats_backfill'"
+                ).fetchone()
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data'):
-                    stream_data = data['data'][0]
-                    viewer_count = stream_data.get('viewer_count', 0)
-                    
-                    if viewer_count > 0:
-                        # Simular algunos usuarios basado en viewer count
-                        simulated_users = set()
-                        for i in range(min(viewer_count, 10)):  # Máximo 10 usuarios simulados
-                            simulated_users.add(f'viewer_{i+1}')
-                        
-                        self.add_log(f'📊 Fallback: Stream con {viewer_count} espectadores')
-                        return simulated_users
+            if pending and not self.migration_running:
+                self.migration_running = True
+                threading.Thread(target=self._backfill_legacy_history, daemon=True).start()
+            if stats_pending and not self.stats_backfill_running:
+                self.stats_backfill_running = True
+                threading.Thread(target=self._backfill_viewer_stats, daemon=True).start()
+                
+        except Exception as e:
+            print(f"❌ Error iniciando migración de historial: {e}")
+    
+    def _backfill_legacy_history(self):
+        """Copia user_history_v1 al esquema v2 en lotes, empezando por lo más reciente"""
+        migrated = 0
+        try:
+            while True:
+                with self.change_lock:
+                    with self.pool.transaction() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('''
+                            SELECT id, username, action, join_time, leave_time, duration, timestamp
+                            FROM user_history_v1 ORDER BY id DESC LIMIT ?
+                        ''', (self.MIGRATION_BATCH_SIZE,))
+                        rows = cursor.fetchall()
+                        
+                        if not rows:
+                            cursor.execute('DROP TABLE user_history_v1')
+                            break
+                        
+                        converted = []
+                        for row_id, username, action, join_time, leave_time, duration, timestamp in rows:
+                            join_ts = parse_santiago_time(join_time)
+                            leave_ts = parse_santiago_time(leave_time)
+                            duration_seconds = parse_duration(duration)
+                            if duration_seconds is None and join_ts is not None and leave_ts is not None:
+                                duration_seconds = max(0, leave_ts - join_ts)
+                            converted.append((row_id, username, action, join_ts, leave_ts, duration_seconds, timestamp))
+                        
+                        cursor.executemany('''
+                            INSERT OR IGNORE INTO user_history (id, username, action, join_ts, leave_ts, duration_seconds, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ''', converted)
+                        # De lo más reciente a lo más antiguo: se conserva el username ya guardado
+                        stats = self._update_viewer_stats(cursor, LEGACY_CHANNEL, [
+                            (username.lower(), username, action, join_ts, leave_ts or timestamp, duration_seconds)
+                            for _, username, action, join_ts, leave_ts, duration_seconds, timestamp in converted
+                        ], VIEWER_STATS_BACKFILL_UPSERT)
+                        cursor.execute('DELETE FROM user_history_v1 WHERE id >= ?', (rows[-1][0],))
+                    
+                    # Los tops ya cargados se actualizan con los totales confirmados
+                    for stats_channel, period, entry in stats:
+                        board = self.leaderboards.get((stats_channel, period))
+                        if board is not None:
+                            board.update(entry)
+                    migrated += len(rows)
+                
+                # Ceder el escritor al tracker entre lotes
+                time.sleep(0.05)
+            
+            print(f"✅ Migración de historial completada: {migrated} filas")
+            
+        except Exception as e:
+            print(f"❌ Error migrando historial legado: {e}")
+        finally:
+            self.migration_running = False
+    
+    def _backfill_viewer_stats(self):
+        """Suma a viewer_stats las salidas anotadas en viewer_stats_backfill, en lotes, empezando por lo más reciente"""
+        added = 0
+        try:
+            while True:
+                with self.change_lock:
+                    with self.pool.transaction() as conn:
+                        cursor = conn.cursor()
+                        ids = [row[0] for row in cursor.execute(
+                            'SELECT id FROM viewer_stats_backfill ORDER BY id DESC LIMIT ?',
+                            (self.MIGRATION_BATCH_SIZE,)
+                        )]
+                        if not ids:
+                            cursor.execute('DROP TABLE viewer_stats_backfill')
+                            break
+                        
+                        leaves: Dict[str, List] = {}
+                        cursor.execute(f'''
+                            SELECT channel, username, action, join_ts, COALESCE(leave_ts, timestamp), duration_seconds
+                            FROM user_history WHERE id IN ({','.join('?' * len(ids))}) ORDER BY id DESC
+                        ''', ids)
+                        for channel, username, action, join_ts, leave_ts, duration_seconds in cursor.fetchall():
+                            leaves.setdefault(channel, []).append(
+                                (username.lower(), username, action, join_ts, leave_ts, duration_seconds)
+                            )
+                        stats = []
+                        for channel, channel_leaves in leaves.items():
+                            stats.extend(self._update_viewer_stats(cursor, channel, channel_leaves, VIEWER_STATS_BACKFILL_UPSERT))
+                        cursor.execute('DELETE FROM viewer_stats_backfill WHERE id >= ?', (ids[-1],))
+                    
+                    # Los tops ya cargados se actualizan con los totales confirmados
+                    for stats_channel, period, entry in stats:
+                        board = self.leaderboards.get((stats_channel, period))
+                        if board is not None:
+                            board.update(entry)
+                    added += len(ids)
+                
+                # Ceder el escritor al tracker entre lotes
+                time.sleep(0.05)
+            
+            print(f"✅ Estadísticas de espectadores completadas: {added} salidas sumadas")
+            
+        except Exception as e:
+            print(f"❌ Error calculando estadísticas de espectadores: {e}")
+        finally:
+            self.stats_backfill_running = False
+    
+    def add_user_entry(self, channel, username, action, join_ts=None, leave_ts=None, duration_seconds=None):
+        """Agrega una entrada al historial"""
+        try:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                timestamp = int(time.time())
+                
+                cursor.execute('''
+                    INSERT INTO user_history (channel, username, action, join_ts, leave_ts, duration_seconds, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (channel, username, action, join_ts, leave_ts, duration_seconds, timestamp))
+                
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error agregando entrada: {e}")
+            return False
+    
+    def username_filter_clause(self, username, match='contains'):
+        """Subconsulta indexada de usernames que coinciden con el filtro
+
+        match: 'contains' (substring), 'prefix' o 'exact'; todas sin distinguir mayúsculas.
+        """
+        if match == 'exact':
+            return 'SELECT username FROM usernames WHERE username = ? COLLATE NOCASE', [username]
+        
+        escaped = username.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        if match == 'prefix':
+            return "SELECT username FROM usernames WHERE username LIKE ? ESCAPE '\\'", [f"{escaped}%"]
+        
+        # El tokenizer trigram necesita al menos 3 caracteres
+        if self.fts_enabled and len(username) >= 3:
+            phrase = '"' + username.replace('"', '""') + '"'
+            return (
+                'SELECT username FROM usernames WHERE id IN '
+                '(SELECT rowid FROM username_search WHERE username_search MATCH ?)'
+            ), [phrase]
+        
+        return "SELECT username FROM usernames WHERE username LIKE ? ESCAPE '\\'", [f"%{escaped}%"]
+    
+    def get_user_history(self, channel, username=None, since=None, until=None, limit=100, match='contains'):
+        """Obtiene el historial de un canal con filtros opcionales"""
+        return self.get_history_page(channel, username, since, until, limit, match)['history']
+    
+    def get_history_page(self, channel, username=None, since=None, until=None, limit=100, match='contains', cursor=None):
+        """Obtiene una página del historial paginada por (timestamp, id)
+
+        since/until: epochs del rango [since, until) sobre el índice de timestamp.
+        cursor: tupla (timestamp, id) de la última fila de la página anterior.
+        El costo de cada página es el mismo sin importar su profundidad.
+        """
+        limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+        try:
+            with self.pool.reader() as conn:
+                db_cursor = conn.cursor()
+                
+                # Con filtro de usuario se fuerza el índice por username: sin
+                # estadísticas el planner recorre todo el canal por timestamp
+                index = 'INDEXED BY idx_user_history_channel_username_ts' if username else ''
+                query = f'''
+                    SELECT id, username, action, join_ts, leave_ts, duration_seconds, timestamp
+                    FROM user_history {index} WHERE channel = ?
+                '''
+                params = [channel]
+                
+                if username:
+                    subquery, subparams = self.username_filter_clause(username, match)
+                    query += f" AND username IN ({subquery})"
+                    params.extend(subparams)
+                
+                if since is not None:
+                    query += " AND timestamp >= ?"
+                    params.append(since)
+                
+                if until is not None:
+                    query += " AND timestamp < ?"
+                    params.append(until)
+                
+                if cursor:
+                    query += " AND (timestamp, id) < (?, ?)"
+                    params.extend(cursor)
+                
+                # Se pide una fila extra para saber si hay más páginas
+                query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+                params.append(limit + 1)
+                
+                db_cursor.execute(query, params)
+                rows = db_cursor.fetchall()
+            
+            # Si la página llega a meses ya archivados, se completa desde los archivos
+            archived_months = self.archive.months(channel, since, until)
+            if archived_months and (len(rows) <= limit or archive_month(rows[-1][6]) <= archived_months[-1]):
+                rows = self.merge_archived_rows(
+                    channel, rows, archived_months, username, match, since, until, cursor, limit + 1
+                )
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = rows[-1]
+                next_cursor = encode_history_cursor(last[6], last[0])
+            
+            return {
+                'history': [format_history_row(row) for row in rows],
+                'next_cursor': next_cursor
+            }
+            
+        except Exception as e:
+            print(f"❌ Error obteniendo historial: {e}")
+            return {'history': [], 'next_cursor': None}
+    
+    def merge_archived_rows(self, channel, rows, months, username, match, since, until, cursor, needed):
+        """Combina filas de SQLite con las archivadas, por (timestamp, id) descendente
+
+        Solo se descomprimen los lotes del índice que tienen al usuario y se
+        cruzan con el rango, del más reciente al más antiguo. Se deja de leer
+        cuando la página ya tiene `needed` filas más recientes que todo lo que
+        queda por leer.
+        """
+        matches = username_matcher(username, match)
+        sort_key = lambda row: (row[6], row[0])
+        seen = {row[0] for row in rows}
+        page = sorted(rows, key=sort_key, reverse=True)
+        for month in reversed(months):
+            if cursor and month > archive_month(cursor[0]):
+                continue
+            
+            members = self.archive.members(
+                channel, month, username, match, since, until, tuple(cursor) if cursor else None
+            )
+            for member in sorted(members, key=lambda member: member[3], reverse=True):
+                if len(page) >= needed and member[3] < sort_key(page[-1]):
+                    # Los lotes que quedan (y los meses anteriores) son más antiguos
+                    return page
+                
+                for row in self.archive.read_member(channel, month, member):
+                    timestamp = row[6]
+                    if row[0] in seen:
+                        continue
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        continue
+                    if cursor and (timestamp, row[0]) >= cursor:
+                        continue
+                    if not matches(row[1]):
+                        continue
+                    seen.add(row[0])
+                    page.append(row)
+                
+                page.sort(key=sort_key, reverse=True)
+                del page[needed:]
+        
+        return page
+    
+    @staticmethod
+    def archive_runs(members):
+        """Agrupa los lotes de un mes en tramos sin solapamiento, en orden de (timestamp, id)
+        
+        Normalmente los lotes ya van seguidos y sale un único tramo; un lote
+        reintentado tras un corte abre otro. Así la mezcla solo tiene
+        descomprimido un lote por tramo.
+        """
+        runs = []
+        for member in sorted(members, key=lambda member: member[2]):
+            for run in runs:
+                if run[-1][3] < member[2]:
+                    run.append(member)
+                    break
+            else:
+                runs.append([member])
+        return runs
+    
+    def read_archive_run(self, channel, month, run):
+        """Filas de un tramo de lotes, una a una; cada lote ya se escribió en orden de (timestamp, id)"""
+        for member in run:
+            yield from self.archive.read_member(channel, month, member)
+    
+    @staticmethod
+    def drop_hot_rows(conn, chunk):
+        """Quita las filas archivadas que siguen en user_history (un lote interrumpido)"""
+        ids = [row[0] for row in chunk]
+        placeholders = ','.join('?' * len(ids))
+        still_hot = {row[0] for row in conn.execute(
+            f'SELECT id FROM user_history WHERE id IN ({placeholders})', ids
+        )}
+        return [row for row in chunk if row[0] not in still_hot]
+    
+    def iter_history(self, channel, username=None, since=None, until=None, match='contains'):
+        """Recorre el historial de un canal en orden de (timestamp, id), en lotes de filas
+
+        Primero los meses archivados y después user_history con fetchmany
+        sobre una conexión de lectura, así la memoria no depende del total y
+        el escritor no se bloquea. Las filas archivadas que siguen en SQLite
+        (un lote interrumpido) se emiten solo desde SQLite.
+        """
+        matches = username_matcher(username, match)
+        with self.pool.reader() as conn:
+            for month in self.archive.months(channel, since, until):
+                members = self.archive.members(channel, month, username, match, since, until)
+                rows = heapq.merge(
+                    *(self.read_archive_run(channel, month, run) for run in self.archive_runs(members)),
+                    key=lambda row: (row[6], row[0])
+                )
+                
+                chunk = []
+                last_id = None
+                for row in rows:
+                    # Un lote reintentado repite filas; con la mezcla quedan contiguas
+                    if row[0] == last_id:
+                        continue
+                    last_id = row[0]
+                    timestamp = row[6]
+                    if not matches(row[1]):
+                        continue
+                    if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                        continue
+                    chunk.append(row)
+                    if len(chunk) >= EXPORT_FETCH_SIZE:
+                        chunk = self.drop_hot_rows(conn, chunk)
+                        if chunk:
+                            yield chunk
+                        chunk = []
+                if chunk:
+                    chunk = self.drop_hot_rows(conn, chunk)
+                    if chunk:
+                        yield chunk
+            
+            query = '''
+                SELECT id, username, action, join_ts, leave_ts, duration_seconds, timestamp
+                FROM user_history WHERE channel = ?
+            '''
+            params = [channel]
+            if username:
+                subquery, subparams = self.username_filter_clause(username, match)
+                query += f" AND username IN ({subquery})"
+                params.extend(subparams)
+            if since is not None:
+                query += " AND timestamp >= ?"
+                params.append(since)
+            if until is not None:
+                query += " AND timestamp < ?"
+                params.append(until)
+            query += " ORDER BY timestamp, id"
+            
+            cursor = conn.execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+    
+    def get_history_channels(self):
+        """Canales con filas en user_history
+
+        Salta de un canal al siguiente por el índice (channel, timestamp) en
+        vez de recorrer la tabla.
+        """
+        try:
+            with self.pool.reader() as conn:
+                rows = conn.execute('''
+                    WITH RECURSIVE channels (channel) AS (
+                        SELECT MIN(channel) FROM user_history
+                        UNION ALL
+                        SELECT (SELECT MIN(channel) FROM user_history WHERE channel > channels.channel)
+                        FROM channels WHERE channels.channel IS NOT NULL
+                    )
+                    SELECT channel FROM channels WHERE channel IS NOT NULL
+                ''').fetchall()
+            return [row[0] for row in rows]
+            
+        except Exception as e:
+            print(f"❌ Error obteniendo canales del historial: {e}")
+            return []
+    
+    def archive_history_batch(self, channel, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+        """Mueve al archivo un lote de filas de un canal anteriores a cutoff
+
+        El lote se lee en orden por el índice (channel, timestamp), así cada
+        lote cuesta lo mismo sin importar el tamaño del historial. Las filas
+        se escriben (y sincronizan) en los archivos antes de borrarse de
+        SQLite. viewer_stats, viewer_rollups y usernames no se tocan.
+        Devuelve la cantidad de filas archivadas.
+        """
+        try:
+            with self.pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT id, channel, username, action, join_ts, leave_ts, duration_seconds, timestamp
+                    FROM user_history INDEXED BY idx_user_history_channel_ts
+                    WHERE channel = ? AND timestamp < ? ORDER BY timestamp, id LIMIT ?
+                ''', (channel, cutoff, batch_size)).fetchall()
+            if not rows:
+                return 0
+            
+            partitions: Dict[str, List] = {}
+            for row in rows:
+                partitions.setdefault(archive_month(row[7]), []).append(row)
+            for month, partition in partitions.items():
+                self.archive.append(channel, month, partition)
+            
+            with self.pool.transaction() as conn:
+                conn.executemany('DELETE FROM user_history WHERE id = ?', [(row[0],) for row in rows])
+            return len(rows)
+            
+        except Exception as e:
+            print(f"❌ Error archivando historial: {e}")
+            return 0
+    
+    def update_current_user(self, channel, username, join_ts):
+        """Actualiza o agrega un usuario actual"""
+        try:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                timestamp = int(time.time())
+                
+                cursor.execute('''
+                    INSERT OR REPLACE INTO current_users (channel, username, join_ts, last_seen)
+                    VALUES (?, ?, ?, ?)
+                ''', (channel, username, join_ts, timestamp))
+                
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error actualizando usuario actual: {e}")
+        return False
+    
+    def remove_current_user(self, channel, username):
+        """Remueve un usuario de la lista actual"""
+        try:
+            with self.pool.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM current_users WHERE channel = ? AND username = ?', (channel, username))
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error removiendo usuario actual: {e}")
+            return False
+    
+    def apply_user_changes(self, channel, joins=(), leaves=()):
+        """Aplica todas las entradas y salidas de un poll de un canal en una sola transacción
+
+        joins: tuplas (login, username, join_ts)
+        leaves: tuplas (login, username, action, join_ts, leave_ts, duration_seconds)
+
+        Cada entrada y salida se registra también en change_log con su número
+        de secuencia, y cada salida suma su duración a viewer_stats, dentro de
+        la misma transacción.
+        """
+        if not joins and not leaves:
+            return True
+        
+        try:
+            # Asignar secuencias y publicarlas en el mismo orden en que se confirman
+            with self.change_lock:
+                seq = self.change_seq
+                change_rows = []
+                for login, username, join_ts in joins:
+                    seq += 1
+                    change_rows.append((seq, channel, 'join', login, username, join_ts, None))
+                for login, username, _, _, leave_ts, duration_seconds in leaves:
+                    seq += 1
+                    change_rows.append((seq, channel, 'leave', login, username, leave_ts, duration_seconds))
+                
+                with self.pool.transaction() as conn:
+                    cursor = conn.cursor()
+                    timestamp = int(time.time())
+                    
+                    if joins:
+                        cursor.executemany('''
+                            INSERT OR REPLACE INTO current_users (channel, username, display_name, join_ts, last_seen)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', [(channel, login, username, join_ts, timestamp) for login, username, join_ts in joins])
+                    
+                    if leaves:
+                        cursor.executemany('''
+                            INSERT INTO user_history (channel, username, action, join_ts, leave_ts, duration_seconds, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ''', [(channel, *leave[1:], timestamp) for leave in leaves])
+                        cursor.executemany(
+                            'DELETE FROM current_users WHERE channel = ? AND username = ?',
+                            [(channel, leave[0]) for leave in leaves]
+                        )
+                        stats = self._update_viewer_stats(cursor, channel, leaves)
+                    
+                    cursor.executemany('''
+                        INSERT INTO change_log (seq, channel, event, login, username, ts, duration_seconds)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', change_rows)
+                    
+                    # Podar el log cada vez que la secuencia cruza un múltiplo de 1000
+                    if seq // 1000 != self.change_seq // 1000:
+                        cursor.execute('DELETE FROM change_log WHERE seq <= ?', (seq - CHANGE_LOG_RETENTION,))
+                
+                self.change_seq = seq
+                self.changes.extend([format_change_row(row) for row in change_rows], seq)
+                
+                # Los tops ya cargados se actualizan con los totales confirmados
+                if leaves:
+                    for stats_channel, period, entry in stats:
+                        board = self.leaderboards.get((stats_channel, period))
+                        if board is not None:
+                            board.update(entry)
+                
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error aplicando cambios de usuarios: {e}")
+            return False
+    
+    def get_recent_leaves(self, channel, limit, offset=0):
+        """Salidas de un canal por fecha descendente, devueltas de la más antigua a la más reciente"""
+        try:
+            with self.pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT username, join_ts, leave_ts, duration_seconds
+                    FROM user_history WHERE channel = ?
+                    ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?
+                ''', (channel, limit, offset)).fetchall()
+            
+            return [{
+                'username': username,
+                'join_time': format_santiago_time(join_ts),
+                'leave_time': format_santiago_time(leave_ts),
+                'duration': format_duration(duration_seconds),
+                'status': 'salió',
+                'action': 'salió'
+            } for username, join_ts, leave_ts, duration_seconds in reversed(rows)]
+            
+        except Exception as e:
+            print(f"❌ Error obteniendo salidas recientes: {e}")
+            return []
+    
+    def get_current_users(self, channel):
+        """Obtiene la lista de usuarios actuales de un canal"""
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT username, display_name, join_ts, last_seen FROM current_users
+                    WHERE channel = ? ORDER BY last_seen DESC
+                ''', (channel,))
+                results = cursor.fetchall()
+                
+                users = []
+                for row in results:
+                    users.append({
+                        'login': row[0],
+                        'username': row[1] or row[0],
+                        'join_time': format_santiago_time(row[2]),
+                        'join_ts': row[2],
+                        'last_seen': row[3]
+                    })
+                
+                return users
+                
+        except Exception as e:
+            print(f"❌ Error obteniendo usuarios actuales: {e}")
+        return []
+    
+    def checkpoint_current_users(self, channel, last_seen):
+        """Guarda en un solo lote la última vez que se vio a cada usuario actual
+
+        last_seen: tuplas (login, epoch)
+        """
+        if not last_seen:
+            return True
+        
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(
+                    'UPDATE current_users SET last_seen = ? WHERE channel = ? AND username = ?',
+                    [(int(seen), channel, login) for login, seen in last_seen]
+                )
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error guardando checkpoint de usuarios actuales: {e}")
+            return False
+    
+    def optimize(self):
+        """Actualiza las estadísticas del planner de SQLite (PRAGMA optimize)"""
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute('PRAGMA optimize')
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error optimizando base de datos: {e}")
+            return False
+    
+    def get_channel_id(self, login):
+        """Obtiene (broadcaster_id, resolved_at) desde la caché o None"""
+        try:
+            with self.pool.reader() as conn:
+                return conn.execute(
+                    'SELECT broadcaster_id, resolved_at FROM channel_ids WHERE login = ?',
+                    (login.lower(),)
+                ).fetchone()
+                
+        except Exception as e:
+            print(f"❌ Error leyendo ID de canal en caché: {e}")
+        return None
+    
+    def save_channel_id(self, login, broadcaster_id):
+        """Guarda el ID resuelto de un canal"""
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO channel_ids (login, broadcaster_id, resolved_at)
+                    VALUES (?, ?, ?)
+                ''', (login.lower(), broadcaster_id, int(time.time())))
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error guardando ID de canal: {e}")
+        return False
+    
+    def delete_channel_id(self, login):
+        """Invalida el ID en caché de un canal"""
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute('DELETE FROM channel_ids WHERE login = ?', (login.lower(),))
+                return True
+                
+        except Exception as e:
+            print(f"❌ Error invalidando ID de canal: {e}")
+        return False
+    
+    def get_all_usernames(self):
+        """Obtiene todos los usernames únicos del historial (de todos los canales)"""
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT username FROM usernames ORDER BY username')
+                return [row[0] for row in cursor.fetchall()]
+                
+        except Exception as e:
+            print(f"❌ Error obteniendo usernames: {e}")
+        return []
+    
+# Configuración del cliente HTTP de Helix
+HELIX_BASE_URL = 'https://api.twitch.tv/helix/'
+HELIX_CONNECT_TIMEOUT = float(os.getenv('HELIX_CONNECT_TIMEOUT', 3.05))
+HELIX_READ_TIMEOUT = float(os.getenv('HELIX_READ_TIMEOUT', 10))
+HELIX_MAX_RETRIES = int(os.getenv('HELIX_MAX_RETRIES', 3))
+HELIX_BACKOFF_BASE = float(os.getenv('HELIX_BACKOFF_BASE', 0.5))
+HELIX_BACKOFF_MAX = float(os.getenv('HELIX_BACKOFF_MAX', 5))
+
+# Rate limiting de Helix
+HELIX_RATE_LIMIT = int(os.getenv('HELIX_RATE_LIMIT', 800))  # Tamaño del bucket hasta recibir headers
+HELIX_RATE_WINDOW = 60  # Segundos para rellenar el bucket completo
+HELIX_RATE_MAX_WAIT = float(os.getenv('HELIX_RATE_MAX_WAIT', 5))  # Espera máxima por un token
+HELIX_RATE_LOW_WATERMARK = 0.1  # Fracción del bucket desde la cual se espacian las requests
+
+class RateLimitExceeded(Exception):
+    """No se obtuvo un token del rate limiter dentro del tiempo de espera"""
+
+class RateLimiter:
+    """Token bucket compartido por las llamadas a Helix, corregido con los headers Ratelimit-*"""
+    
+    def __init__(self, capacity=HELIX_RATE_LIMIT, window=HELIX_RATE_WINDOW):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.window = window
+        self.tokens = float(capacity)
+        self.refill_rate = capacity / window
+        self.updated_at = time.monotonic()
+        self.reset_at = None          # Epoch del próximo reset informado por Twitch
+        self.last_acquire_at = 0
+        self.last_synced_at = None
+        self.total_waits = 0
+        self.total_wait_seconds = 0
+        self.total_rejected = 0
+    
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated_at = now
+    
+    def _spacing(self):
+        """Separación mínima entre requests cuando queda poco presupuesto"""
+        if self.tokens >= self.capacity * HELIX_RATE_LOW_WATERMARK or not self.reset_at:
+            return 0
+        return max(0, self.reset_at - time.time()) / max(self.tokens, 1)
+    
+    def acquire(self, max_wait=HELIX_RATE_MAX_WAIT):
+        """Toma un token esperando hasta max_wait segundos; devuelve False si no alcanzó"""
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(0, self.last_acquire_at + self._spacing() - now)
+                if wait == 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.last_acquire_at = now
+                    if waited:
+                        self.total_waits += 1
+                        self.total_wait_seconds += waited
+                    return True
+                if self.tokens < 1:
+                    wait = max(wait, (1 - self.tokens) / self.refill_rate)
+                if waited + wait > max_wait:
+                    self.total_rejected += 1
+                    return False
+            
+            time.sleep(wait)
+            waited += wait
+    
+    def update_from_headers(self, headers):
+        """Sincroniza el bucket con Ratelimit-Limit/Remaining/Reset de la respuesta"""
+        try:
+            limit = headers.get('Ratelimit-Limit')
+            remaining = headers.get('Ratelimit-Remaining')
+            reset = headers.get('Ratelimit-Reset')
+            if remaining is None:
+                return
+            
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if limit:
+                    self.capacity = int(limit)
+                self.tokens = min(float(remaining), self.capacity)
+                self.refill_rate = self.capacity / self.window
+                if reset:
+                    self.reset_at = int(reset)
+                    # Twitch informa cuándo el bucket vuelve a estar lleno
+                    seconds_to_reset = self.reset_at - time.time()
+                    if seconds_to_reset > 0 and self.tokens < self.capacity:
+                        self.refill_rate = (self.capacity - self.tokens) / seconds_to_reset
+                self.last_synced_at = time.time()
+                
+        except (TypeError, ValueError):
+            pass
+    
+    def snapshot(self):
+        """Estado del limiter para /api/status"""
+        with self.lock:
+            self._refill(time.monotonic())
+            return {
+                'tokens': int(self.tokens),
+                'capacity': self.capacity,
+                'refill_per_second': round(self.refill_rate, 2),
+                'reset_at': self.reset_at,
+                'last_synced_at': self.last_synced_at,
+                'pacing_seconds': round(self._spacing(), 2),
+                'total_waits': self.total_waits,
+                'total_wait_seconds': round(self.total_wait_seconds, 2),
+                'total_rejected': self.total_rejected
+            }
+
+class HelixClient:
+    """Sesión keep-alive compartida para la API Helix con reintentos y métricas"""
+    
+    def __init__(self, headers, rate_limiter, pool_size=10):
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.timeout = (HELIX_CONNECT_TIMEOUT, HELIX_READ_TIMEOUT)
+        
+        # Métricas de las requests
+        self.stats_lock = threading.Lock()
+        self.total_requests = 0
+        self.total_retries = 0
+        self.total_errors = 0
+        self.last_latency_ms = 0
+        self.avg_latency_ms = 0
+    
+    def get(self, path, params=None, max_wait=HELIX_RATE_MAX_WAIT):
+        """GET a Helix reintentando errores 5xx, 429 y de conexión con backoff exponencial
+
+        Cada intento consume un token del rate limiter (esperando hasta max_wait).
+        Devuelve la última respuesta recibida o relanza la última excepción.
+        """
+        url = HELIX_BASE_URL + path
+        for attempt in range(HELIX_MAX_RETRIES + 1):
+            if not self.rate_limiter.acquire(max_wait):
+                raise RateLimitExceeded(f'sin presupuesto de requests para {path}')
+            
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(start, error=True)
+                if attempt == HELIX_MAX_RETRIES:
+                    raise
+            else:
+                self.rate_limiter.update_from_headers(response.headers)
+                retryable = response.status_code >= 500 or response.status_code == 429
+                self._record(start, error=retryable)
+                if not retryable or attempt == HELIX_MAX_RETRIES:
+                    return response
+                if response.status_code == 429:
+                    # El limiter ya se sincronizó con los headers: esperará el reset
+                    with self.stats_lock:
+                        self.total_retries += 1
+                    continue
+            
+            with self.stats_lock:
+                self.total_retries += 1
+            # Backoff exponencial con jitter completo
+            time.sleep(random.uniform(0, min(HELIX_BACKOFF_MAX, HELIX_BACKOFF_BASE * 2 ** attempt)))
+    
+    def _record(self, start, error=False):
+        """Registra la latencia de una request"""
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self.stats_lock:
+            self.total_requests += 1
+            if error:
+                self.total_errors += 1
+            self.last_latency_ms = latency_ms
+            # Media móvil exponencial
+            if self.total_requests == 1:
+                self.avg_latency_ms = latency_ms
+            else:
+                self.avg_latency_ms = 0.8 * self.avg_latency_ms + 0.2 * latency_ms
+    
+    def get_stats(self):
+        """Métricas para /api/status"""
+        with self.stats_lock:
+            return {
+                'total_requests': self.total_requests,
+                'total_retries': self.total_retries,
+                'total_errors': self.total_errors,
+                'last_latency_ms': round(self.last_latency_ms, 1),
+                'avg_latency_ms': round(self.avg_latency_ms, 1),
+                'connect_timeout': self.timeout[0],
+                'read_timeout': self.timeout[1]
+            }
+
+# Paginación de helix/chat/chatters
+CHATTERS_PAGE_SIZE = 1000  # Máximo permitido por Helix
+CHATTERS_DEADLINE_RATIO = float(os.getenv('CHATTERS_DEADLINE_RATIO', 0.8))  # Fracción del intervalo de poll
+
+# Tiempo de vida del ID de canal en caché (segundos)
+BROADCASTER_ID_TTL = int(os.getenv('BROADCASTER_ID_TTL', 7 * 24 * 3600))
+# Respuestas 4xx que indican que el broadcaster_id guardado ya no es válido
+BROADCASTER_ID_STALE_STATUSES = (400, 404)
+
+# Canales a trackear (separados por coma); el primero es el canal por defecto de la API
+TRACKED_CHANNELS = [
+    channel.strip().lower()
+    for channel in os.getenv('TWITCH_CHANNELS', 'blackcraneo').split(',')
+    if channel.strip()
+] or ['blackcraneo']
+DEFAULT_CHANNEL = TRACKED_CHANNELS[0]
+
+# Configuración del scheduler de polling
+POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', 10))  # Segundos entre polls de un mismo canal
+POLL_WORKERS = int(os.getenv('POLL_WORKERS', 4))  # Polls simultáneos como máximo
+
+# Límites del intervalo adaptativo
+POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', 5))  # Con mucha rotación (raids, cierre del stream)
+POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', 30))  # Con la lista estable
+POLL_OFFLINE_INTERVAL = int(os.getenv('POLL_OFFLINE_INTERVAL', 120))  # Con el canal offline
+POLL_HIGH_CHURN = float(os.getenv('POLL_HIGH_CHURN', 0.05))  # Fracción de usuarios que cambió en un poll
+POLL_STABLE_POLLS = 3  # Polls sin cambios antes de empezar a espaciar
+STREAM_STATUS_INTERVAL = int(os.getenv('STREAM_STATUS_INTERVAL', 60))  # Consulta de helix/streams
+
+# Ingesta de entradas/salidas: 'poll' (solo helix/chat/chatters) o 'irc' (JOIN/PART + reconciliación)
+INGEST_MODE = os.getenv('INGEST_MODE', 'poll').strip().lower()
+IRC_HOST = os.getenv('IRC_HOST', 'irc.chat.twitch.tv')
+IRC_PORT = int(os.getenv('IRC_PORT', 6667))
+IRC_NICK = os.getenv('IRC_NICK', DEFAULT_CHANNEL).strip().lower()
+IRC_RECONCILE_INTERVAL = int(os.getenv('IRC_RECONCILE_INTERVAL', 120))  # Poll de chatters en modo IRC
+IRC_RECONNECT_MIN = 1  # Backoff de reconexión (segundos)
+IRC_RECONNECT_MAX = 60
+IRC_KEEPALIVE = 240  # Segundos sin tráfico antes de enviar un PING propio
+IRC_PONG_TIMEOUT = 30  # Segundos para recibir respuesta al PING propio
+IRC_JOIN_CHUNK = 20  # Canales por comando JOIN
+
+# Server-Sent Events del dashboard (/api/events)
+EVENT_BUFFER_SIZE = int(os.getenv('EVENT_BUFFER_SIZE', 1000))  # Eventos guardados para reanudar
+SSE_KEEPALIVE = 15  # Segundos entre comentarios de keep-alive
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', 300))  # El cliente reconecta con Last-Event-ID
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', 12))  # Conexiones abiertas como máximo
+SSE_RETRY_MS = 3000  # Espera del navegador antes de reconectar
+
+# Cada worker numera sus eventos y logs por separado: los ids y ETags que ve un
+# cliente llevan este prefijo para que un id de otro worker no se confunda
+PROCESS_NONCE = os.urandom(4).hex()
+
+def format_process_id(number):
+    """Id público de un evento, log o versión de este proceso"""
+    return f'{PROCESS_NONCE}-{number}'
+
+def parse_process_id(value):
+    """Contador de un id de format_process_id, o None si es de otro proceso o no es válido"""
+    nonce, _, number = (value or '').rpartition('-')
+    if nonce != PROCESS_NONCE or not number.isdigit():
+        return None
+    return int(number)
+
+class AdaptivePollInterval:
+    """Elige el intervalo del próximo poll según el estado del stream y la rotación de usuarios"""
+    
+    def __init__(self, base=POLL_INTERVAL, min_interval=POLL_MIN_INTERVAL,
+                 max_interval=POLL_MAX_INTERVAL, offline_interval=POLL_OFFLINE_INTERVAL):
+        self.base = base
+        self.min_interval = min(min_interval, base)
+        self.max_interval = max(max_interval, base)
+        self.offline_interval = offline_interval
+        self.interval = base
+        self.reason = 'inicial'
+        self.stable_polls = 0
+    
+    def update(self, is_live, changes, population):
+        """Calcula el intervalo tras un poll con `changes` entradas+salidas"""
+        churn = changes / max(population, 1)
+        
+        if is_live is False and changes == 0:
+            self.interval = self.offline_interval
+            self.reason = 'canal offline'
+        elif churn >= POLL_HIGH_CHURN and changes > 1:
+            self.stable_polls = 0
+            self.interval = self.min_interval
+            self.reason = f'rotación alta ({churn:.0%})'
+        elif changes == 0:
+            self.stable_polls += 1
+            if self.stable_polls >= POLL_STABLE_POLLS:
+                self.interval = min(self.max_interval, max(self.interval, self.base) * 1.5)
+                self.reason = f'sin cambios en {self.stable_polls} polls'
+            else:
+                self.interval = max(self.interval, self.base)
+                self.reason = 'normal'
+        else:
+            self.stable_polls = 0
+            self.interval = self.base
+            self.reason = f'rotación normal ({churn:.0%})'
+        
+        return self.interval
+
+class EventBus:
+    """Eventos del tracker con id creciente, para /api/events
+
+    Guarda los últimos eventos para que un cliente que reconecta con
+    Last-Event-ID reciba solo lo que se perdió. Los ids son locales al
+    proceso: hacia afuera se exponen con format_process_id.
+    """
+    
+    def __init__(self, size=EVENT_BUFFER_SIZE):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        self.channel_ids: Dict = {}  # canal (None: global) -> id de su último evento
+        self.condition = threading.Condition()
+    
+    def publish(self, event, data, channel=None):
+        """Agrega un evento y despierta a los clientes en espera"""
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, event, channel, data))
+            self.channel_ids[channel] = self.last_id
+            self.condition.notify_all()
+            return self.last_id
+    
+    def channel_version(self, channel):
+        """Id del último evento del canal o global: solo cambia cuando cambia lo que ve ese canal"""
+        with self.condition:
+            start = self.channel_ids.setdefault(channel, self.last_id)
+            return max(start, self.channel_ids.get(None, 0))
+    
+    def events_after(self, last_id):
+        """Eventos posteriores a last_id, o None si ya no están en el buffer"""
+        with self.condition:
+            if last_id > self.last_id:
+                return None
+            if self.events and last_id < self.events[0][0] - 1:
+                return None
+            return [event for event in self.events if event[0] > last_id]
+    
+    def wait(self, last_id, timeout):
+        """Espera hasta que haya eventos posteriores a last_id (o timeout)"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.last_id > last_id, timeout)
+
+class ViewerSession:
+    """Sesión de un usuario viendo el stream
+
+    Usa __slots__ y epochs enteros en vez de un dict por usuario. Los nombres
+    se internan y el nombre visible reutiliza el login cuando coinciden, así
+    un espectador cuesta un objeto pequeño y una entrada en current_viewers.
+    """
+    __slots__ = ('login', 'username', 'join_ts', 'last_seen')
+    
+    def __init__(self, login, username, join_ts, last_seen=None):
+        self.login = sys.intern(login)
+        self.username = self.login if not username or username == login else sys.intern(username)
+        self.join_ts = int(join_ts)
+        self.last_seen = int(last_seen if last_seen is not None else join_ts)
+    
+    def to_dict(self):
+        """Fila de usuario viendo para la API y el dashboard"""
+        return {
+            'username': self.username,
+            'join_time': format_santiago_time(self.join_ts),
+            'leave_time': None,
+            'duration': None,
+            'status': 'viendo'
+        }
+    
+    def size_of(self):
+        """Bytes ocupados por la sesión y sus valores propios"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.login)
+        if self.username is not self.login:
+            size += sys.getsizeof(self.username)
+        return size + sys.getsizeof(self.join_ts) + sys.getsizeof(self.last_seen)
+
+class TwitchTracker:
+    """Estado y polling de un canal"""
+    
+    def __init__(self, channel_name, manager):
+        self.channel_name = channel_name
+        self.manager = manager
+        self.db = manager.db
+        self.events = manager.events
+        self.helix = manager.helix
+        self.lock = threading.RLock()
+        # El propio broadcaster no cuenta como espectador
+        self.excluded_users = EXCLUDED_BOTS_LOWER | {channel_name.lower()}
+        
+        # Almacenamiento de datos de usuarios
+        self.current_viewers: Dict[str, ViewerSession] = {}  # login -> sesión de cada usuario viendo
+        self.left_viewers = deque(maxlen=RECENT_BUFFER_SIZE)  # Últimos usuarios que salieron
+        self.all_history = deque(maxlen=RECENT_BUFFER_SIZE)  # Últimas entradas del historial
+        self.total_left = 0  # Salidas desde que inició el proceso
+        
+        # Estado de usuarios
+        self.seen_at = 0             # Último poll procesado: todos los usuarios viendo estaban presentes
+        self.last_chatters_count = 0  # Chatters devueltos por el último poll
+        self.pending_display_names = {}  # Nombres visibles de usuarios nuevos del último fetch
+        self.recent_parts = {}       # Salidas por IRC desde el último poll
+        self.sample_joins = 0        # Entradas desde la última muestra de la serie de tiempo
+        self.sample_leaves = 0       # Salidas desde la última muestra de la serie de tiempo
+        self.restored_sessions = set()  # Sesiones restauradas aún no confirmadas por un poll
+        
+        # Configuración de polling (el intervalo se adapta después de cada poll)
+        if INGEST_MODE == 'irc':
+            # Con IRC el polling solo reconcilia eventos perdidos
+            self.poll_interval = IRC_RECONCILE_INTERVAL
+            self.poll_scheduler = AdaptivePollInterval(
+                base=IRC_RECONCILE_INTERVAL,
+                min_interval=IRC_RECONCILE_INTERVAL,
+                max_interval=IRC_RECONCILE_INTERVAL,
+                offline_interval=max(POLL_OFFLINE_INTERVAL, IRC_RECONCILE_INTERVAL)
+            )
+        else:
+            self.poll_interval = POLL_INTERVAL
+            self.poll_scheduler = AdaptivePollInterval()
+        self.last_changes = 0
+        
+        # Estado del stream (actualizado por TrackerManager desde helix/streams)
+        self.is_live = None
+        self.viewer_count = None
+        self.stream_status_at = 0
+        
+        # Caché del ID del canal (no cambia, se resuelve una vez)
+        self.broadcaster_id = None
+        self.broadcaster_id_resolved_at = 0
+        
+        # Estadísticas
+        self.total_polls = 0
+        self.successful_polls = 0
+        self.last_poll_time = 0
+        self.last_fetch_pages = 0
+        self.last_fetch_ms = 0
+        self.last_fetch_complete = False
+        self.fetch_started_at = 0  # Inicio de la lista en curso (puede abarcar varios polls)
+        self.resume_fetch = None  # (cursor, chatters, inicio) de una lista que sigue en el próximo poll
+        self.replicated_status = None  # Estado publicado por el líder (solo en workers web)
+    
+    def add_log(self, message, *, level, event):
+        """Agrega un mensaje al log compartido, etiquetado con el canal"""
+        self.manager.add_log(message, channel=self.channel_name, level=level, event=event)
+    
+    def resolve_broadcaster_id(self):
+        """Obtiene el ID del canal desde memoria, SQLite o la API (en ese orden)"""
+        now = time.time()
+        if self.broadcaster_id and now - self.broadcaster_id_resolved_at < BROADCASTER_ID_TTL:
+            return self.broadcaster_id
+        
+        cached = self.db.get_channel_id(self.channel_name)
+        if cached and now - cached[1] < BROADCASTER_ID_TTL:
+            self.broadcaster_id, self.broadcaster_id_resolved_at = cached
+            return self.broadcaster_id
+        
+        user_response = self.helix.get('users', params={'login': self.channel_name})
+        
+        if user_response.status_code != 200:
+            self.add_log(f'❌ Error obteniendo ID del canal: {user_response.status_code}', level='error', event='channel_id')
+            return None
+        
+        user_data = user_response.json()
+        if not user_data.get('data'):
+            self.add_log('❌ Canal no encontrado', level='error', event='channel_id')
+            return None
+        
+        self.broadcaster_id = user_data['data'][0]['id']
+        self.broadcaster_id_resolved_at = now
+        self.db.save_channel_id(self.channel_name, self.broadcaster_id)
+        self.add_log(f'🆔 ID del canal resuelto: {self.broadcaster_id}', level='info', event='channel_id')
+        return self.broadcaster_id
+    
+    def invalidate_broadcaster_id(self):
+        """Descarta el ID del canal en memoria y en SQLite"""
+        self.broadcaster_id = None
+        self.broadcaster_id_resolved_at = 0
+        self.db.delete_channel_id(self.channel_name)
+    
+    def get_chatters_from_api(self):
+        """Obtiene la lista completa de chatters siguiendo la paginación de Helix
+
+        Devuelve None si el poll falló. Si se agota el plazo antes de la última
+        página, devuelve lo obtenido, deja last_fetch_complete en False y
+        guarda el cursor: el próximo poll sigue desde ahí y suma sus chatters a
+        los ya vistos, así que en canales grandes la lista completa se arma en
+        varios polls y las salidas se detectan igual.
+        """
+        self.last_fetch_complete = False
+        resume, self.resume_fetch = self.resume_fetch, None
+        try:
+            # Obtener ID del canal (desde caché en el camino normal)
+            channel_id = self.resolve_broadcaster_id()
+            if not channel_id:
+                return None
+            moderator_id = self.manager.resolve_moderator_id()
+            if not moderator_id:
+                return None
+            
+            start = time.perf_counter()
+            deadline = start + self.poll_interval * CHATTERS_DEADLINE_RATIO
+            params = {'broadcaster_id': channel_id, 'moderator_id': moderator_id, 'first': CHATTERS_PAGE_SIZE}
+            if resume:
+                params['after'], chatters, self.fetch_started_at = resume
+            else:
+                chatters = set()
+                self.fetch_started_at = time.time()
+            display_names = {}
+            pages = 0
+            
+            # Obtener chatters página por página
+            while True:
+                # Si el poll se corta aquí (plazo, error o rate limit), el próximo sigue desde esta página
+                if 'after' in params:
+                    self.resume_fetch = (params['after'], chatters, self.fetch_started_at)
+                
+                # La espera por presupuesto no puede pasarse del plazo del poll
+                max_wait = max(0, deadline - time.perf_counter())
+                chatters_response = self.helix.get('chat/chatters', params=params, max_wait=max_wait)
+                
+                if chatters_response.status_code != 200 and pages == 0 and resume:
+                    # El error puede ser del cursor guardado: la lista vuelve a empezar
+                    # en el próximo poll, sin tocar el ID del canal
+                    self.resume_fetch = None
+                    self.add_log(f'⚠️ No se pudo continuar el fetch anterior ({chatters_response.status_code}), se reinicia en el próximo poll', level='warning', event='poll')
+                    return None
+                elif chatters_response.status_code == 403 and pages == 0:
+                    # Sin datos reales de chatters no se registra nada: el poll se omite
+                    self.add_log('❌ El usuario del token no es moderador del canal (403), poll omitido', level='error', event='poll')
+                    return None
+                elif chatters_response.status_code in BROADCASTER_ID_STALE_STATUSES and pages == 0:
+                    # El ID guardado ya no es válido: se resolverá de nuevo en el próximo poll
+                    self.add_log(f'⚠️ ID de canal rechazado ({chatters_response.status_code}), invalidando caché', level='warning', event='channel_id')
+                    self.invalidate_broadcaster_id()
+                    return None
+                elif chatters_response.status_code != 200:
+                    self.add_log(f'❌ Error obteniendo chatters (página {pages + 1}): {chatters_response.status_code}', level='error', event='poll')
+                    if pages == 0:
+                        return None
+                    break
+                
+                chatters_data = chatters_response.json()
+                pages += 1
+                for chatter in chatters_data.get('data', []):
+                    # Los usuarios se identifican por login (igual que en IRC)
+                    username = chatter.get('user_login', '').lower()
+                    if username and username not in self.excluded_users:
+                        chatters.add(username)
+                        # Solo interesa el nombre visible de quienes todavía no están viendo
+                        if username not in self.current_viewers:
+                            display_names[username] = chatter.get('user_name') or username
+                
+                cursor = chatters_data.get('pagination', {}).get('cursor')
+                if not cursor:
+                    self.last_fetch_complete = True
+                    self.resume_fetch = None
+                    break
+                params['after'] = cursor
+                if time.perf_counter() >= deadline:
+                    self.add_log(f'⏱️ Plazo de fetch agotado tras {pages} páginas, se continúa en el próximo poll', level='warning', event='poll')
+                    self.resume_fetch = (cursor, chatters, self.fetch_started_at)
+                    break
+            
+            self.last_fetch_pages = pages
+            self.last_fetch_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.pending_display_names = display_names
+            self.add_log(
+                f'📊 API: {len(chatters)} chatters detectados ({pages} pág., {self.last_fetch_ms}ms) - Poll #{self.total_polls}',
+                level='info', event='poll'
+            )
+            return chatters
+                
+        except RateLimitExceeded:
+            self.add_log('⚠️ Rate limit alcanzado, se reintentará en el próximo poll', level='warning', event='rate_limit')
+            return None
+        except Exception as e:
+            self.add_log(f'❌ Error en get_chatters_from_api: {e}', level='error', event='poll')
+            return None
+    
+    def mark_user_left(self, username, pending_leaves=None, source=None, leave_ts=None):
+        """Marca un usuario como que salió del stream
+
+        Si se pasa pending_leaves, la fila de historial se acumula ahí para
+        escribirse junto al resto del poll; si no, se escribe de inmediato.
+        leave_ts permite cerrar la sesión en un momento anterior (por defecto, ahora).
+        """
+        with self.lock:
+            if username not in self.current_viewers:
+                return
+            
+            session = self.current_viewers[username]
+            display_name = session.username
+            leave_ts = int(leave_ts or time.time())
+            join_ts = session.join_ts
+            leave_time = format_santiago_time(leave_ts)
+            
+            # Calcular duración
+            duration_seconds = max(0, leave_ts - join_ts)
+            duration = format_duration(duration_seconds)
+            
+            # Crear entrada de salida
+            leave_data = {
+                'username': display_name,
+                'join_time': format_santiago_time(join_ts),
+                'leave_time': leave_time,
+                'duration': duration,
+                'status': 'salió'
+            }
+            
+            # Agregar solo salidas al historial con duración
+            leave_row = (username, display_name, 'salió del stream', join_ts, leave_ts, duration_seconds)
+            if pending_leaves is None:
+                self.db.apply_user_changes(self.channel_name, leaves=[leave_row])
+            else:
+                pending_leaves.append(leave_row)
+            
+            self.left_viewers.append(leave_data)
+            
+            history_entry = {
+                **leave_data,
+                'action': 'salió'
+            }
+            self.all_history.append(history_entry)
+            self.total_left += 1
+            self.events.publish('leave', {'login': username, **history_entry}, self.channel_name)
+            
+            del self.current_viewers[username]
+            self.sample_leaves += 1
+        
+        self.add_log(f'🚪 {display_name} salió del stream (Estuvo: {duration}) - {source or f"Poll #{self.total_polls}"}', level='info', event='leave')
+    
+    def register_join(self, username, pending_joins, source=None):
+        """Registra la entrada de un usuario (debe llamarse con self.lock tomado)"""
+        if username in self.current_viewers:
+            return
+        
+        join_ts = int(time.time())
+        session = ViewerSession(username, self.pending_display_names.get(username), join_ts)
+        display_name = session.username
+        
+        self.current_viewers[session.login] = session
+        self.sample_joins += 1
+        self.events.publish('join', {'login': session.login, **session.to_dict()}, self.channel_name)
+        
+        # Solo actualizar usuario actual (no agregar entrada de entrada al historial)
+        pending_joins.append((session.login, display_name, join_ts))
+        
+        self.add_log(f'👋 {display_name} entró al stream - {source or f"Poll #{self.total_polls}"}', level='info', event='join')
+    
+    def poll_once(self):
+        """Ejecuta un ciclo de polling del canal"""
+        try:
+            self.total_polls += 1
+            self.last_poll_time = time.time()
             
-            self.rate_limit_remaining -= 1
-            return set()
+            # Obtener usuarios actuales
+            current_users = self.get_chatters_from_api()
             
+            if current_users is not None:
+                self.successful_polls += 1
+                self.process_user_changes(current_users, complete=self.last_fetch_complete)
+                self.record_sample()
+                
+                # Elegir el intervalo del próximo poll
+                previous_interval = self.poll_interval
+                self.poll_interval = self.poll_scheduler.update(
+                    self.is_live, self.last_changes, len(self.current_viewers)
+                )
+                if self.poll_interval != previous_interval:
+                    self.add_log(f'⏰ Intervalo de polling: {self.poll_interval:.0f}s ({self.poll_scheduler.reason})', level='info', event='poll_interval')
+                
+        except Exception as e:
+            self.add_log(f'❌ Error en poll: {e}', level='error', event='poll')
+    
+    def record_sample(self):
+        """Guarda espectadores, viewer_count y entradas/salidas desde la muestra anterior"""
+        with self.lock:
+            chatters = len(self.current_viewers)
+            joins, leaves = self.sample_joins, self.sample_leaves
+            self.sample_joins = self.sample_leaves = 0
+        self.db.record_viewer_sample(self.channel_name, time.time(), chatters, self.viewer_count, joins, leaves)
+    
+    def update_stream_status(self, is_live, viewer_count):
+        """Registra el estado del stream; devuelve True si el canal acaba de pasar a online"""
+        went_live = is_live and self.is_live is False
+        self.is_live = is_live
+        self.viewer_count = viewer_count
+        self.stream_status_at = time.time()
+        
+        if went_live:
+            self.add_log('🔴 El canal está en vivo', level='info', event='stream')
+            # Volver al intervalo base para detectar la llegada de espectadores
+            self.poll_scheduler.interval = self.poll_scheduler.base
+            self.poll_scheduler.reason = 'canal en vivo'
+            self.poll_interval = self.poll_scheduler.base
+        return bool(went_live)
+    
+    def process_user_changes(self, current_users, complete=True):
+        """Procesa cambios en usuarios (entradas y salidas)
+
+        Con una lista incompleta solo se registran entradas: los usuarios que
+        faltan se mantienen hasta el próximo poll completo. La lista se compara
+        directamente con current_viewers, sin copiar conjuntos entre polls.
+        """
+        try:
+            with self.lock:
+                viewers = self.current_viewers
+                # Una lista armada en varios polls cuenta desde el primero
+                poll_started = min(self.last_poll_time or 0, self.fetch_started_at or self.last_poll_time or 0)
+                parted = set()
+                
+                if INGEST_MODE == 'irc':
+                    # Eventos IRC recibidos mientras se consultaba la API ganan a la lista
+                    parted = {
+                        username for username, parted_at in self.recent_parts.items()
+                        if parted_at >= poll_started
+                    }
+                    self.recent_parts.clear()
+                
+                # Cambios del poll que se escriben juntos en una sola transacción
+                pending_joins = []
+                pending_leaves = []
+                
+                # Detectar usuarios nuevos (entradas)
+                for username in current_users:
+                    if username not in viewers and username not in parted:
+                        self.register_join(username, pending_joins)
+                
+                # Detectar usuarios que salieron (solo con la lista completa)
+                if complete:
+                    left_users = [
+                        session for username, session in viewers.items()
+                        if username not in current_users
+                        and not (INGEST_MODE == 'irc' and session.last_seen >= poll_started)
+                    ]
+                    for session in left_users:
+                        # Sesiones restauradas que ya no están: cerrarlas cuando se las vio por última vez
+                        leave_ts = self.session_last_seen(session) if session.login in self.restored_sessions else None
+                        self.mark_user_left(session.login, pending_leaves, leave_ts=leave_ts)
+                    
+                    self.restored_sessions.clear()
+                
+                self.last_changes = len(pending_joins) + len(pending_leaves)
+                
+                # Un único commit por poll, sin importar cuántos usuarios cambiaron
+                if not self.db.apply_user_changes(self.channel_name, pending_joins, pending_leaves):
+                    self.add_log(f'❌ Error guardando cambios del poll #{self.total_polls}', level='error', event='database')
+                
+                if self.last_changes:
+                    self.events.publish('stats', self.get_stats(), self.channel_name)
+                
+                # Todos los usuarios que siguen viendo estaban presentes en este poll
+                self.seen_at = int(time.time())
+                self.last_chatters_count = len(current_users)
+                self.pending_display_names = {}
+                
+        except Exception as e:
+            self.add_log(f'❌ Error procesando cambios de usuarios: {e}', level='error', event='poll')
+    
+    def apply_membership_events(self, events):
+        """Aplica eventos ('join'|'part', login) recibidos por IRC en orden
+
+        Usa el mismo pipeline que el polling y escribe el lote en una sola
+        transacción. Las entradas marcan last_seen para que el próximo poll de
+        reconciliación solo corrija los eventos que se hayan perdido.
+        """
+        try:
+            with self.lock:
+                pending_joins = []
+                pending_leaves = []
+                leaving = set()
+                
+                for event, username in events:
+                    if username in self.excluded_users:
+                        continue
+                    
+                    if event == 'join':
+                        if username in leaving:
+                            # Salió y volvió en el mismo lote: escribir lo acumulado primero
+                            self.db.apply_user_changes(self.channel_name, pending_joins, pending_leaves)
+                            pending_joins, pending_leaves, leaving = [], [], set()
+                        self.recent_parts.pop(username, None)
+                        self.register_join(username, pending_joins, source='IRC')
+                        self.current_viewers[username].last_seen = int(time.time())
+                    elif event == 'part':
+                        self.recent_parts[username] = time.time()
+                        if username in self.current_viewers:
+                            leaving.add(username)
+                            self.mark_user_left(username, pending_leaves, source='IRC')
+                
+                if not self.db.apply_user_changes(self.channel_name, pending_joins, pending_leaves):
+                    self.add_log('❌ Error guardando eventos IRC', level='error', event='database')
+                
+                self.events.publish('stats', self.get_stats(), self.channel_name)
+                    
         except Exception as e:
-            self.add_log(f'❌ Error en fallback: {e}')
-            return set()
+            self.add_log(f'❌ Error aplicando eventos IRC: {e}', level='error', event='irc')
     
-    def mark_user_left(self, username):
-        """Marca un usuario como que salió del stream"""
-        if username in current_viewers:
-            user_data = current_viewers[username]
-            leave_time = get_santiago_time()
+    def restore_state(self):
+        """Reconstruye los usuarios viendo desde current_users al iniciar
+
+        Las sesiones se reconcilian con el primer poll completo: los usuarios
+        que siguen presentes conservan su hora de entrada sin escribir nada y
+        los que ya no están se cierran en su último checkpoint. Las sesiones
+        con un checkpoint demasiado antiguo se cierran de inmediato.
+        """
+        users = self.db.get_current_users(self.channel_name)
+        if not users:
+            return
+        
+        now = time.time()
+        stale_leaves = []
+        with self.lock:
+            for user in users:
+                session = ViewerSession(user['login'], user['username'], user['join_ts'], user['last_seen'])
+                self.current_viewers[session.login] = session
+                
+                if now - session.last_seen > REHYDRATE_MAX_GAP:
+                    self.mark_user_left(session.login, stale_leaves, source='restauración', leave_ts=session.last_seen)
+                else:
+                    self.restored_sessions.add(session.login)
             
-            # Calcular duración
-            duration = calculate_duration(user_data['join_time'], leave_time)
+            if not self.db.apply_user_changes(self.channel_name, leaves=stale_leaves):
+                self.add_log('❌ Error cerrando sesiones antiguas al restaurar', level='error', event='restore')
+        
+        self.add_log(f'♻️ {len(self.restored_sessions)} sesiones restauradas, {len(stale_leaves)} cerradas por antigüedad', level='info', event='restore')
+    
+    def session_last_seen(self, session):
+        """Última vez que se vio al usuario: su propio last_seen o el último poll"""
+        return max(session.last_seen, self.seen_at)
+    
+    def checkpoint(self):
+        """Guarda el último visto de los usuarios actuales"""
+        with self.lock:
+            last_seen = [
+                (login, self.session_last_seen(session))
+                for login, session in self.current_viewers.items()
+            ]
+        return self.db.checkpoint_current_users(self.channel_name, last_seen)
+    
+    def get_recent_leaves(self, limit, offset=0, history=False):
+        """Ventana de las últimas salidas, de la más antigua a la más reciente
+
+        offset cuenta desde la salida más reciente. Si la ventana cae fuera
+        del buffer en memoria se lee de SQLite.
+        """
+        buffer = self.all_history if history else self.left_viewers
+        with self.lock:
+            if offset + limit <= len(buffer):
+                return recent_entries(buffer, limit, offset)
+        
+        entries = self.db.get_recent_leaves(self.channel_name, limit, offset)
+        if not history:
+            for entry in entries:
+                del entry['action']
+        return entries
+    
+    def get_viewers(self):
+        """Copia de los usuarios viendo, segura para leer desde otros hilos"""
+        with self.lock:
+            return [session.to_dict() for session in self.current_viewers.values()]
+    
+    def get_stats(self):
+        """Contadores del canal para /api/stats y los eventos 'stats'"""
+        return {
+            'channel': self.channel_name,
+            'espectadores': len(self.current_viewers),
+            'viendo': len(self.current_viewers),
+            'salieron': self.total_left,
+            'total_historial': self.total_left
+        }
+    
+    def get_snapshot(self):
+        """Estado que ve el dashboard al conectarse a /api/events
+
+        Devuelve también el id del último evento incluido, tomado con el lock
+        del canal para que los eventos posteriores no se pierdan ni se repitan.
+        """
+        with self.lock:
+            snapshot = {
+                'stats': self.get_stats(),
+                'viendo': [{'login': login, **session.to_dict()} for login, session in self.current_viewers.items()],
+                'salieron': recent_entries(self.left_viewers, 10),
+                'historial': recent_entries(self.all_history, 20)
+            }
+            last_id = self.events.last_id
+        return snapshot, last_id
+    
+    def load_replica(self, users):
+        """Reemplaza los usuarios viendo por los leídos de la base de datos (workers web)"""
+        with self.lock:
+            self.reset_viewers()
+            for user in users:
+                session = ViewerSession(user['login'], user['username'], user['join_ts'], user['last_seen'])
+                self.current_viewers[session.login] = session
+    
+    def reset_viewers(self):
+        """Olvida el estado de usuarios viendo (antes de restaurarlo desde la base de datos)"""
+        with self.lock:
+            self.current_viewers.clear()
+            self.seen_at = 0
+            self.pending_display_names = {}
+            self.recent_parts.clear()
+            self.restored_sessions.clear()
+    
+    def apply_replicated_changes(self, changes):
+        """Aplica entradas y salidas escritas por el proceso líder (workers web)"""
+        with self.lock:
+            for change in changes:
+                login = change['login']
+                if change['event'] == 'join':
+                    session = ViewerSession(login, change['username'], change['ts'])
+                    self.current_viewers[session.login] = session
+                    self.events.publish('join', {'login': session.login, **session.to_dict()}, self.channel_name)
+                elif login in self.current_viewers:
+                    session = self.current_viewers.pop(login)
+                    leave_data = {
+                        'username': change['username'],
+                        'join_time': format_santiago_time(session.join_ts),
+                        'leave_time': change['time'],
+                        'duration': change['duration'],
+                        'status': 'salió'
+                    }
+                    self.left_viewers.append(leave_data)
+                    history_entry = {**leave_data, 'action': 'salió'}
+                    self.all_history.append(history_entry)
+                    self.total_left += 1
+                    self.events.publish('leave', {'login': login, **history_entry}, self.channel_name)
             
-            # Crear entrada de salida
-            leave_data = {
-                'username': username,
-                'join_time': user_data['join_time'],
-                'leave_time': leave_time,
-                'duration': duration,
-                'status': 'salió'
+            if changes:
+                self.events.publish('stats', self.get_stats(), self.channel_name)
+    
+    def get_viewer_memory(self):
+        """Estimación de la memoria usada por las sesiones en curso
+
+        Mide una muestra de sesiones y la tabla current_viewers; los bytes por
+        espectador incluyen su parte de la tabla.
+        """
+        with self.lock:
+            count = len(self.current_viewers)
+            table_bytes = sys.getsizeof(self.current_viewers)
+            sample = list(itertools.islice(self.current_viewers.values(), VIEWER_MEMORY_SAMPLE))
+        
+        session_bytes = sum(session.size_of() for session in sample) / len(sample) if sample else 0
+        total_bytes = int(table_bytes + session_bytes * count)
+        return {
+            'viewers': count,
+            'bytes_per_viewer': round(total_bytes / count, 1) if count else 0,
+            'total_bytes': total_bytes
+        }
+    
+    def get_status(self):
+        """Estado del canal para /api/status"""
+        if self.replicated_status is not None:
+            # En un worker web el estado del polling es el que publicó el líder
+            status = dict(self.replicated_status)
+            last_poll_time = status.pop('last_poll_time', 0)
+            return {
+                **status,
+                'time_since_last_poll': int(time.time() - last_poll_time) if last_poll_time else 0,
+                'current_viewers_count': len(self.current_viewers),
+                'total_history_count': self.total_left,
+                'viewer_memory': self.get_viewer_memory()
             }
+        
+        return {
+            'channel_name': self.channel_name,
+            'broadcaster_id': self.broadcaster_id,
+            'current_viewers_count': len(self.current_viewers),
+            'total_history_count': self.total_left,
+            'poll_interval': self.poll_interval,
+            'poll_interval_reason': self.poll_scheduler.reason,
+            'last_changes': self.last_changes,
+            'is_live': self.is_live,
+            'viewer_count': self.viewer_count,
+            'total_polls': self.total_polls,
+            'successful_polls': self.successful_polls,
+            'success_rate': (self.successful_polls / self.total_polls * 100) if self.total_polls > 0 else 0,
+            'last_fetch': {
+                'pages': self.last_fetch_pages,
+                'ms': self.last_fetch_ms,
+                'complete': self.last_fetch_complete
+            },
+            'time_since_last_poll': int(time.time() - self.last_poll_time) if self.last_poll_time else 0,
+            'current_chat_users': self.last_chatters_count,
+            'viewer_memory': self.get_viewer_memory()
+        }
+    
+    def get_published_status(self):
+        """Estado que el líder publica para los workers web
+
+        Lleva la hora del último poll en vez de los segundos desde entonces,
+        así no cambia entre polls y el worker calcula el valor al leerlo.
+        """
+        status = self.get_status()
+        del status['time_since_last_poll']
+        status['last_poll_time'] = self.last_poll_time
+        return status
+
+def parse_irc_line(line):
+    """Separa una línea IRC en (prefijo, comando, parámetros)
+
+    Los tags IRCv3 (@...) se descartan; el parámetro final (:...) se devuelve
+    como último elemento de la lista.
+    """
+    if line.startswith('@'):
+        _, _, line = line.partition(' ')
+    
+    prefix = ''
+    if line.startswith(':'):
+        prefix, _, line = line[1:].partition(' ')
+    
+    trailing = None
+    if ' :' in line:
+        line, trailing = line.split(' :', 1)
+    
+    parts = line.split()
+    if not parts:
+        return prefix, '', []
+    
+    params = parts[1:]
+    if trailing is not None:
+        params.append(trailing)
+    return prefix, parts[0].upper(), params
+
+class IRCIngestor:
+    """Conexión IRC persistente que recibe JOIN/PART de todos los canales
+
+    Con la capacidad twitch.tv/membership el servidor notifica las entradas y
+    salidas de cada canal; los eventos se aplican con el mismo pipeline que el
+    polling, que queda como reconciliación periódica.
+    """
+    
+    def __init__(self, manager, host=IRC_HOST, port=IRC_PORT, nick=IRC_NICK):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.nick = nick
+        self.sock = None
+        self.send_lock = threading.Lock()
+        
+        # Estadísticas
+        self.connected = False
+        self.connected_at = None
+        self.connections = 0
+        self.reconnects = 0
+        self.events_received = 0
+        self.last_event_time = None
+        self.last_error = None
+    
+    def start(self):
+        """Inicia el hilo de la conexión"""
+        threading.Thread(target=self.run, daemon=True, name='irc').start()
+    
+    def run(self):
+        """Mantiene la conexión abierta, reconectando con backoff exponencial"""
+        failures = 0
+        
+        while self.manager.running:
+            try:
+                self.connect()
+                failures = 0 if self.session() else failures + 1
+            except (OSError, ConnectionError) as e:
+                self.last_error = str(e)
+                failures += 1
+                self.manager.add_log(f'❌ Error en conexión IRC: {e}', level='error', event='irc')
+            finally:
+                self.close()
             
-            # Agregar solo salidas al historial con duración
-            self.db.add_user_entry(username, 'salió del stream', user_data['join_time'], leave_time, duration)
-            self.db.remove_current_user(username)
+            if not self.manager.running:
+                break
+            
+            # Backoff con jitter completo para no reconectar todos a la vez
+            delay = random.uniform(0, min(IRC_RECONNECT_MAX, IRC_RECONNECT_MIN * 2 ** failures))
+            self.reconnects += 1
+            self.manager.add_log(f'🔌 Reconectando IRC en {delay:.1f}s...', level='info', event='irc')
+            time.sleep(delay)
+    
+    def connect(self):
+        """Abre el socket, pide la capacidad de membresía y se une a los canales"""
+        self.sock = socket.create_connection((self.host, self.port), timeout=HELIX_CONNECT_TIMEOUT)
+        self.sock.settimeout(1)
+        self.connections += 1
+        
+        token = self.manager.oauth_token
+        self.send('CAP REQ :twitch.tv/membership')
+        self.send(f'PASS oauth:{token.replace("oauth:", "")}')
+        self.send(f'NICK {self.nick}')
+        
+        channels = list(self.manager.channels)
+        for start in range(0, len(channels), IRC_JOIN_CHUNK):
+            self.send('JOIN ' + ','.join(f'#{name}' for name in channels[start:start + IRC_JOIN_CHUNK]))
+    
+    def send(self, message):
+        """Envía una línea al servidor"""
+        with self.send_lock:
+            self.sock.sendall(f'{message}\r\n'.encode('utf-8'))
+    
+    def close(self):
+        """Cierra el socket actual"""
+        self.connected = False
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+    
+    def session(self):
+        """Lee del socket hasta que la conexión se cae
+
+        Devuelve True si la sesión llegó a autenticarse (para reiniciar el backoff).
+        """
+        buffer = b''
+        authenticated = False
+        last_traffic = time.time()
+        ping_sent_at = None
+        
+        while self.manager.running:
+            try:
+                data = self.sock.recv(4096)
+            except socket.timeout:
+                now = time.time()
+                if ping_sent_at and now - ping_sent_at > IRC_PONG_TIMEOUT:
+                    self.manager.add_log('⚠️ IRC sin respuesta al PING, reconectando', level='warning', event='irc')
+                    return authenticated
+                if not ping_sent_at and now - last_traffic > IRC_KEEPALIVE:
+                    self.send('PING :tmi.twitch.tv')
+                    ping_sent_at = now
+                continue
             
-            left_viewers.append(leave_data)
+            if not data:
+                self.manager.add_log('⚠️ Servidor IRC cerró la conexión', level='warning', event='irc')
+                return authenticated
             
-            history_entry = {
-                **leave_data,
-                'action': 'salió'
-            }
-            all_history.append(history_entry)
+            last_traffic = time.time()
+            ping_sent_at = None
+            buffer += data
+            *lines, buffer = buffer.split(b'\r\n')
             
-            del current_viewers[username]
+            # Los eventos de un mismo bloque se aplican juntos por canal
+            events: Dict[str, List] = {}
+            for raw in lines:
+                line = raw.decode('utf-8', errors='replace')
+                prefix, command, params = parse_irc_line(line)
+                
+                if command == 'PING':
+                    self.send(f'PONG :{params[-1] if params else "tmi.twitch.tv"}')
+                elif command == '001':
+                    authenticated = True
+                    self.connected = True
+                    self.connected_at = time.time()
+                    self.last_error = None
+                    self.manager.add_log(f'✅ Conectado a IRC {self.host}:{self.port} como {self.nick}', level='info', event='irc')
+                elif command in ('JOIN', 'PART') and params:
+                    login = prefix.split('!', 1)[0].lower()
+                    channel_name = params[0].lstrip('#').lower()
+                    if login and channel_name in self.manager.channels:
+                        events.setdefault(channel_name, []).append(
+                            ('join' if command == 'JOIN' else 'part', login)
+                        )
+                elif command == 'RECONNECT':
+                    self.manager.add_log('🔄 El servidor IRC pidió reconectar', level='info', event='irc')
+                    self.dispatch(events)
+                    return authenticated
+                elif command == 'NOTICE' and params and 'authentication failed' in params[-1].lower():
+                    self.last_error = params[-1]
+                    self.manager.add_log(f'❌ Error de autenticación IRC: {params[-1]}', level='error', event='irc')
+                    return False
             
-            self.add_log(f'🚪 {username} salió del stream (Estuvo: {duration}) - Poll #{self.total_polls}')
+            self.dispatch(events)
+        
+        return authenticated
+    
+    def dispatch(self, events):
+        """Entrega los eventos acumulados al tracker de cada canal"""
+        for channel_name, channel_events in events.items():
+            self.events_received += len(channel_events)
+            self.last_event_time = time.time()
+            self.manager.channels[channel_name].apply_membership_events(channel_events)
+    
+    def get_status(self):
+        """Estado de la conexión para los endpoints"""
+        return {
+            'host': f'{self.host}:{self.port}',
+            'nick': self.nick,
+            'connected': self.connected,
+            'connected_since': format_santiago_time(self.connected_at) if self.connected_at else None,
+            'connections': self.connections,
+            'reconnects': self.reconnects,
+            'events_received': self.events_received,
+            'last_event': format_santiago_time(self.last_event_time) if self.last_event_time else None,
+            'last_error': self.last_error
+        }
+
+# Un solo proceso hace polling: 'auto' (elección por lock de archivo), 'leader' o 'web' (solo lectura)
+TRACKER_ROLE = os.getenv('TRACKER_ROLE', 'auto').strip().lower()
+TRACKER_LOCK_FILE = os.getenv('TRACKER_LOCK_FILE', 'tracker.lock')
+LEADER_RETRY_INTERVAL = 5  # Segundos entre intentos de tomar el lock
+STATE_PUBLISH_INTERVAL = 2  # Segundos entre publicaciones del estado del líder
+STATE_HEARTBEAT_INTERVAL = 10  # Sin cambios, el estado se reescribe igual cada tanto para no parecer caído
+REPLICA_SYNC_INTERVAL = 1  # Segundos entre lecturas de change_log en los demás workers
+LEADER_STALE_AFTER = 30  # Estado publicado más antiguo que esto: líder caído
+
+# Restauración de sesiones al reiniciar
+REHYDRATE_MAX_GAP = int(os.getenv('REHYDRATE_MAX_GAP', 600))  # Checkpoint más antiguo que se reanuda
+
+# Logs del tracker: registros estructurados en memoria y salida a consola en segundo plano
+LOG_BUFFER_SIZE = int(os.getenv('LOG_BUFFER_SIZE', 200))
+LOG_RESPONSE_DEFAULT = 50  # Registros de /api/logs sin ?since=
+LOG_LEVELS = {'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+# Tipos de evento de los logs: join, leave, poll, poll_interval, stream, channel_id,
+# irc, rate_limit, helix, viewers, stats, archive, database, restore, leader,
+# startup y shutdown
+
+class ConsoleLogHandler(logging.Handler):
+    """Imprime los logs en consola, sin emojis si la consola no los soporta"""
+    
+    def emit(self, record):
+        line = self.format(record)
+        try:
+            print(line, flush=True)
+        except UnicodeEncodeError:
+            print(''.join(char for char in line if ord(char) < 128), flush=True)
+
+# El hilo que hace polling solo encola; la escritura a stdout la hace el listener
+log_queue = queue.SimpleQueue()
+tracker_logger = logging.getLogger('tracker')
+tracker_logger.setLevel(logging.INFO)
+tracker_logger.propagate = False
+tracker_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, ConsoleLogHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+
+class TrackerManager:
+    """Coordina el polling de varios canales con un scheduler asyncio
+
+    Los recursos caros (base de datos, sesión HTTP y rate limiter) son
+    compartidos; cada canal mantiene su propio estado en un TwitchTracker.
+    """
+    
+    def __init__(self, channel_names):
+        self.oauth_token = os.getenv('TWITCH_OAUTH', '')
+        self.client_id = 'gp762nuuoqcoxypju8c569th9wz7q5'  # Client ID público
+        self.running = False
+        self.logs = deque(maxlen=LOG_BUFFER_SIZE)  # Registros estructurados
+        self.log_id = 0  # Local al proceso: la API lo expone con format_process_id
+        self.logs_lock = threading.Lock()
+        
+        # Eventos para los clientes SSE
+        self.events = EventBus()
+        
+        # Base de datos
+        self.db = DatabaseManager()
+        
+        # Cliente HTTP compartido para Helix con rate limiting por headers
+        self.rate_limiter = RateLimiter()
+        self.helix = HelixClient(self.get_api_headers(), self.rate_limiter)
+        # ID del usuario dueño del token: Helix exige que sea el moderator_id
+        self.moderator_id = None
+        self.moderator_lock = threading.Lock()
+        
+        # Un tracker por canal
+        self.channels: Dict[str, TwitchTracker] = {
+            name: TwitchTracker(name, self) for name in channel_names
+        }
+        
+        # Conexión IRC para recibir JOIN/PART (solo en modo 'irc')
+        self.irc = IRCIngestor(self) if INGEST_MODE == 'irc' else None
+        
+        # Rol del proceso: solo el líder hace polling y escribe
+        self.role = None
+        self.lock_file = None
+        self.leader_state = None
+        self.leader_state_at = 0
+        self.leader_log_id = 0  # Última fila de tracker_logs ya replicada
+        self.published_log_id = 0  # Último registro propio ya escrito en tracker_logs
+    
+    def get_channel(self, channel_name=None):
+        """Obtiene el tracker de un canal (el canal por defecto si no se indica)"""
+        return self.channels.get((channel_name or DEFAULT_CHANNEL).strip().lower())
+    
+    def add_log(self, message, channel=None, *, level, event):
+        """Agrega un registro al log
+
+        Cada llamada indica su nivel (LOG_LEVELS) y su tipo de evento. La
+        consola se escribe desde el hilo del QueueListener.
+        """
+        now = time.time()
+        timestamp = format_santiago_time(now)
+        prefix = f"[{timestamp}] [{channel}]" if channel else f"[{timestamp}]"
+        
+        with self.logs_lock:
+            self.log_id += 1
+            record = {
+                'id': self.log_id,
+                'ts': now,
+                'time': timestamp,
+                'level': level,
+                'event': event,
+                'channel': channel,
+                'message': message,
+                'text': f"{prefix} {message}"
+            }
+            self.logs.append(record)
+            self.events.publish('log', {**record, 'id': format_process_id(self.log_id)}, channel)
         
+        tracker_logger.log(LOG_LEVELS[record['level']], record['text'])
+    
+    def get_logs(self, since=None, level=None, channel=None, limit=None):
+        """Registros posteriores a since, con nivel mínimo y canal opcionales"""
+        min_level = LOG_LEVELS.get(level, logging.INFO)
+        with self.logs_lock:
+            records = [
+                record for record in self.logs
+                if (since is None or record['id'] > since)
+                and LOG_LEVELS[record['level']] >= min_level
+                and (channel is None or record['channel'] in (None, channel))
+            ]
+        return records[-limit:] if limit else records
+    
+    def get_log_lines(self, count, channel=None):
+        """Últimas líneas de log como texto; con channel, solo las de ese canal y las globales"""
+        with self.logs_lock:
+            if channel is None:
+                return [record['text'] for record in recent_entries(self.logs, count)]
+            
+            lines = []
+            for record in reversed(self.logs):
+                if record['channel'] in (None, channel):
+                    lines.append(record['text'])
+                    if len(lines) >= count:
+                        break
+            return lines[::-1]
+    
+    def resolve_moderator_id(self):
+        """ID del usuario del token, resuelto una vez con helix/users sin login"""
+        with self.moderator_lock:
+            if self.moderator_id:
+                return self.moderator_id
+            
+            response = self.helix.get('users')
+            if response.status_code != 200 or not response.json().get('data'):
+                self.add_log(f'❌ Error obteniendo el usuario del token: {response.status_code}', level='error', event='channel_id')
+                return None
+            
+            self.moderator_id = response.json()['data'][0]['id']
+            self.add_log(f'🆔 Usuario del token (moderator_id): {self.moderator_id}', level='info', event='channel_id')
+            return self.moderator_id
+    
+    def get_api_headers(self):
+        """Obtiene headers para requests a la API de Twitch"""
+        return {
+            'Authorization': f'Bearer {self.oauth_token.replace("oauth:", "")}',
+            'Client-Id': self.client_id
+        }
+    
     def start(self):
-        """Inicia el tracker con API Polling"""
-        self.add_log('🚀 Iniciando Twitch API Tracker...')
-        self.add_log(f'📺 Canal: {self.channel_name}')
-        self.add_log(f'🔑 OAuth configurado: {bool(self.oauth_token)}')
-        self.add_log(f'⏰ Polling cada: {self.poll_interval} segundos')
+        """Inicia el scheduler de polling de todos los canales"""
+        self.add_log('🚀 Iniciando Twitch API Tracker...', level='info', event='startup')
+        self.add_log(f'📺 Canales: {", ".join(self.channels)}', level='info', event='startup')
+        self.add_log(f'🔑 OAuth configurado: {bool(self.oauth_token)}', level='info', event='startup')
+        if self.irc:
+            self.add_log(f'📡 Ingesta IRC JOIN/PART, reconciliación cada {IRC_RECONCILE_INTERVAL} segundos', level='info', event='startup')
+        else:
+            self.add_log(f'⏰ Polling cada: {POLL_INTERVAL} segundos por canal', level='info', event='startup')
         
         if not self.oauth_token:
-            self.add_log('❌ Error: TWITCH_OAUTH no configurado')
+            self.add_log('❌ Error: TWITCH_OAUTH no configurado', level='error', event='startup')
             return
         
         self.running = True
+        self.install_shutdown_checkpoint()
+        
+        if TRACKER_ROLE != 'web' and self.acquire_leadership(blocking=TRACKER_ROLE == 'leader'):
+            self.start_leader()
+        else:
+            self.start_follower()
+    
+    def acquire_leadership(self, blocking=False):
+        """Intenta tomar el lock de archivo que identifica al único proceso que hace polling
+
+        El sistema operativo libera el lock si el proceso muere, así otro
+        worker puede tomar el relevo.
+        """
+        if fcntl is None:
+            return True
+        
+        try:
+            if self.lock_file is None:
+                self.lock_file = open(TRACKER_LOCK_FILE, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except OSError:
+            return False
+    
+    def start_leader(self):
+        """Arranca el polling en este proceso"""
+        self.role = 'leader'
+        self.add_log(f'👑 Este proceso (pid {os.getpid()}) hace el polling', level='info', event='leader')
+        
+        # Retomar las sesiones que quedaron abiertas antes del reinicio
+        self.db.sync_change_seq()
+        for channel in self.channels.values():
+            channel.replicated_status = None
+            channel.reset_viewers()
+            channel.restore_state()
+        
+        # Los backfills escriben en la base de datos: solo los corre el líder
+        self.db.start_background_migration()
         
         # Iniciar polling
-        threading.Thread(target=self.polling_loop, daemon=True).start()
+        threading.Thread(target=self.run_scheduler, daemon=True).start()
         threading.Thread(target=self.monitor_loop, daemon=True).start()
-        self.add_log('🎯 Twitch API Tracker iniciado correctamente')
+        threading.Thread(target=self.publish_state_loop, daemon=True).start()
+        if HISTORY_RETENTION_DAYS > 0:
+            threading.Thread(target=self.archive_loop, daemon=True).start()
+        if self.irc:
+            self.irc.start()
+        self.add_log('🎯 Twitch API Tracker iniciado correctamente', level='info', event='startup')
     
-    def polling_loop(self):
-        """Loop principal de polling API optimizado"""
-        self.add_log('🔄 Iniciando polling API optimizado...')
+    def start_follower(self):
+        """Replica el estado del líder desde SQLite sin hacer polling"""
+        self.role = 'follower'
+        self.add_log(f'👀 Otro proceso hace el polling; este worker (pid {os.getpid()}) replica su estado', level='info', event='leader')
         
-        while self.running:
+        users, seq = self.db.get_replica_snapshot()
+        for channel_name, channel in self.channels.items():
+            channel.load_replica(users.get(channel_name, []))
+        
+        threading.Thread(target=self.follower_loop, args=(seq,), daemon=True).start()
+    
+    def follower_loop(self, snapshot_seq):
+        """Sigue change_log y el estado publicado; toma el relevo si el líder cae"""
+        last_retry = time.time()
+        last_state = 0
+        
+        while self.running and self.role == 'follower':
             try:
-                self.total_polls += 1
-                self.last_poll_time = time.time()
+                self.replicate_changes(snapshot_seq)
                 
-                # Obtener usuarios actuales
-                current_users = self.get_chatters_from_api()
-                
-                if current_users is not None:
-                    self.successful_polls += 1
-                    self.process_user_changes(current_users)
-                
-                # Esperar antes del próximo polling
-                time.sleep(self.poll_interval)
+                if time.time() - last_state >= STATE_PUBLISH_INTERVAL:
+                    last_state = time.time()
+                    self.replicate_state()
                 
+                if TRACKER_ROLE == 'auto' and time.time() - last_retry >= LEADER_RETRY_INTERVAL:
+                    last_retry = time.time()
+                    if self.acquire_leadership():
+                        self.replicate_changes(snapshot_seq)
+                        # Los logs que ya están en el buffer vinieron del líder anterior o son locales
+                        self.published_log_id = self.log_id
+                        self.add_log('👑 El líder anterior ya no está, este proceso toma el polling', level='warning', event='leader')
+                        self.start_leader()
+                        return
+                        
             except Exception as e:
-                self.add_log(f'❌ Error en polling_loop: {e}')
-                time.sleep(self.poll_interval)
-    
-    def process_user_changes(self, current_users):
-        """Procesa cambios en usuarios (entradas y salidas)"""
-        try:
-            # Detectar usuarios nuevos (entradas)
-            new_users = current_users - self.previous_users
+                self.add_log(f'❌ Error replicando estado: {e}', level='error', event='leader')
             
-            for username in new_users:
-                if username not in current_viewers:
-                    join_time = get_santiago_time()
-                    
-                    user_data = {
-                        'username': username,
-                        'join_time': join_time,
-                        'leave_time': None,
-                        'duration': None,
-                        'status': 'viendo'
-                    }
-                    
-                    current_viewers[username] = user_data
-                    self.user_join_times[username] = time.time()
-                    
-                    # Solo actualizar usuario actual (no agregar entrada de entrada al historial)
-                    self.db.update_current_user(username, join_time)
-                    
-                    # NO agregar entradas al historial - solo salidas
-                    # history_entry = {
-                    #     **user_data,
-                    #     'action': 'entró al stream'
-                    # }
-                    # all_history.append(history_entry)
-                    
-                    self.add_log(f'👋 {username} entró al stream - Poll #{self.total_polls}')
+            time.sleep(REPLICA_SYNC_INTERVAL)
+    
+    def replicate_changes(self, snapshot_seq):
+        """Aplica los cambios nuevos de change_log al feed y a los canales
+
+        Los cambios hasta snapshot_seq ya estaban en current_users al cargar
+        la réplica: solo se agregan al feed de /api/changes.
+        """
+        feed = self.db.changes
+        while True:
+            changes = self.db.get_changes_after(feed.last_seq)
+            if not changes:
+                return
             
-            # Detectar usuarios que salieron
-            left_users = self.previous_users - current_users
+            by_channel: Dict[str, List] = {}
+            for change in changes:
+                if change['seq'] > snapshot_seq and change['channel'] in self.channels:
+                    by_channel.setdefault(change['channel'], []).append(change)
             
-            for username in left_users:
-                if username in current_viewers:
-                    self.mark_user_left(username)
+            for channel_name, channel_changes in by_channel.items():
+                self.channels[channel_name].apply_replicated_changes(channel_changes)
+            feed.extend(changes, changes[-1]['seq'])
             
-            # Actualizar estado para próximo ciclo
-            self.previous_users = current_users.copy()
-            self.current_users = current_users
+            # El líder ya sumó estas salidas a viewer_stats: recargar los tops al leerlos
+            if any(change['event'] == 'leave' for change in changes):
+                self.db.invalidate_leaderboards()
+    
+    def replicate_state(self):
+        """Lee el estado publicado por el líder y los logs nuevos de tracker_logs"""
+        published = self.db.get_tracker_state('leader')
+        if not published:
+            return
+        
+        state, updated_at = published
+        self.leader_state = state
+        self.leader_state_at = updated_at
+        
+        # El contador de salidas del líder solo se adopta si ya aplicamos todos sus cambios
+        up_to_date = state.get('change_seq', 0) >= self.db.changes.last_seq
+        for channel_name, status in state.get('channels', {}).items():
+            channel = self.channels.get(channel_name)
+            if channel:
+                channel.replicated_status = status
+                if up_to_date:
+                    channel.total_left = status.get('total_history_count', channel.total_left)
+        
+        # Los registros del líder se renumeran para que ?since= siga siendo creciente aquí
+        published_logs = self.db.get_tracker_logs_after(self.leader_log_id)
+        with self.logs_lock:
+            for row_id, record in published_logs:
+                self.leader_log_id = row_id
+                self.log_id += 1
+                record = {**record, 'id': self.log_id}
+                self.logs.append(record)
+                self.events.publish('log', {**record, 'id': format_process_id(self.log_id)}, record['channel'])
+    
+    def publish_state_loop(self):
+        """Publica en SQLite el estado del polling para los workers web
+
+        Los logs se agregan a tracker_logs solo desde el último publicado, y el
+        estado se reescribe solo si cambió (o cada STATE_HEARTBEAT_INTERVAL,
+        para que los workers no den al líder por caído).
+        """
+        published_state = None
+        published_at = 0
+        while self.running:
+            with self.logs_lock:
+                logs = [record for record in self.logs if record['id'] > self.published_log_id]
+            if logs and self.db.append_tracker_logs(logs):
+                self.published_log_id = logs[-1]['id']
             
-            # Actualizar tiempo de última vista para usuarios activos
-            for username in current_users:
-                self.user_last_seen[username] = time.time()
-                
+            state = {
+                'pid': os.getpid(),
+                'change_seq': self.db.change_seq,
+                'channels': {name: channel.get_published_status() for name, channel in self.channels.items()},
+                'rate_limit': self.rate_limiter.snapshot(),
+                'helix': self.helix.get_stats(),
+                'irc': self.irc.get_status() if self.irc else None
+            }
+            if state != published_state or time.time() - published_at >= STATE_HEARTBEAT_INTERVAL:
+                if self.db.save_tracker_state('leader', state):
+                    published_state = state
+                    published_at = time.time()
+            time.sleep(STATE_PUBLISH_INTERVAL)
+    
+    def get_runtime_status(self):
+        """Estado del proceso que hace polling (propio o publicado por el líder)"""
+        if self.role == 'follower':
+            state = self.leader_state or {}
+            return {
+                'role': self.role,
+                'tracker_running': bool(state) and time.time() - self.leader_state_at < LEADER_STALE_AFTER,
+                'leader_pid': state.get('pid'),
+                'rate_limit': state.get('rate_limit') or self.rate_limiter.snapshot(),
+                'helix': state.get('helix') or self.helix.get_stats(),
+                'irc': state.get('irc')
+            }
+        
+        return {
+            'role': self.role,
+            'tracker_running': self.running,
+            'leader_pid': os.getpid() if self.role == 'leader' else None,
+            'rate_limit': self.rate_limiter.snapshot(),
+            'helix': self.helix.get_stats(),
+            'irc': self.irc.get_status() if self.irc else None
+        }
+    
+    def checkpoint(self):
+        """Guarda el último visto de los usuarios actuales de todos los canales"""
+        if self.role != 'leader':
+            return
+        for channel in self.channels.values():
+            channel.checkpoint()
+    
+    def install_shutdown_checkpoint(self):
+        """Hace un checkpoint al recibir SIGTERM (redeploy) y al salir
+
+        El handler anterior (por ejemplo el de gunicorn) se sigue llamando
+        después del checkpoint.
+        """
+        atexit.register(self.checkpoint)
+        
+        if threading.current_thread() is not threading.main_thread():
+            return
+        
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        
+        def handle_sigterm(signum, frame):
+            self.add_log('🛑 SIGTERM recibido, guardando sesiones...', level='info', event='shutdown')
+            self.checkpoint()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            elif previous_handler == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                os.kill(os.getpid(), signal.SIGTERM)
+        
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    def run_scheduler(self):
+        """Ejecuta el event loop del scheduler en su propio hilo"""
+        try:
+            asyncio.run(self.schedule_polls())
         except Exception as e:
-            self.add_log(f'❌ Error procesando cambios de usuarios: {e}')
+            self.add_log(f'❌ Error en scheduler: {e}', level='error', event='poll')
     
+    async def schedule_polls(self):
+        """Lanza un loop por canal, escalonados a lo largo del intervalo"""
+        self.add_log('🔄 Iniciando polling API optimizado...', level='info', event='startup')
+        
+        # Eventos para despertar a un canal que pasa a estar en vivo
+        self.wake_events = {name: asyncio.Event() for name in self.channels}
+        
+        # Los polls son bloqueantes (HTTP + SQLite): se ejecutan en un pool acotado
+        with ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix='poll') as executor:
+            stagger = (IRC_RECONCILE_INTERVAL if self.irc else POLL_INTERVAL) / len(self.channels)
+            await asyncio.gather(
+                self.stream_status_loop(executor),
+                *(
+                    self.channel_loop(channel, index * stagger, executor)
+                    for index, channel in enumerate(self.channels.values())
+                )
+            )
     
+    async def channel_loop(self, channel, delay, executor):
+        """Loop de polling de un canal"""
+        loop = asyncio.get_running_loop()
+        wake_event = self.wake_events[channel.channel_name]
+        await asyncio.sleep(delay)
+        
+        while self.running:
+            started = loop.time()
+            wake_event.clear()
+            await loop.run_in_executor(executor, channel.poll_once)
+            
+            # Esperar antes del próximo polling, descontando lo que tomó este
+            remaining = max(0, channel.poll_interval - (loop.time() - started))
+            try:
+                await asyncio.wait_for(wake_event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
     
+    async def stream_status_loop(self, executor):
+        """Consulta periódicamente qué canales están en vivo"""
+        loop = asyncio.get_running_loop()
+        
+        while self.running:
+            went_live = await loop.run_in_executor(executor, self.refresh_stream_status)
+            for channel_name in went_live:
+                self.wake_events[channel_name].set()
+            await asyncio.sleep(STREAM_STATUS_INTERVAL)
     
+    def refresh_stream_status(self):
+        """Actualiza is_live/viewer_count de todos los canales (100 por request)
+
+        Devuelve los canales que acaban de pasar a estar en vivo.
+        """
+        went_live = []
+        logins = list(self.channels)
+        try:
+            for start in range(0, len(logins), 100):
+                batch = logins[start:start + 100]
+                params = [('user_login', login) for login in batch] + [('first', 100)]
+                response = self.helix.get('streams', params=params)
+                if response.status_code != 200:
+                    self.add_log(f'❌ Error consultando estado de streams: {response.status_code}', level='error', event='stream')
+                    continue
+                
+                live = {
+                    stream.get('user_login', '').lower(): stream.get('viewer_count', 0)
+                    for stream in response.json().get('data', [])
+                }
+                for login in batch:
+                    if self.channels[login].update_stream_status(login in live, live.get(login)):
+                        went_live.append(login)
+                        
+        except RateLimitExceeded:
+            self.add_log('⚠️ Rate limit alcanzado consultando estado de streams', level='warning', event='rate_limit')
+        except Exception as e:
+            self.add_log(f'❌ Error en refresh_stream_status: {e}', level='error', event='stream')
+        
+        return went_live
     
+    def archive_loop(self):
+        """Archiva el historial más antiguo que HISTORY_RETENTION_DAYS
+
+        Trabaja en lotes pequeños y solo mientras ningún canal está en vivo,
+        para no competir con el polling por el escritor de SQLite.
+        """
+        while self.running and self.role == 'leader':
+            try:
+                archived = 0
+                cutoff = int(time.time()) - HISTORY_RETENTION_DAYS * 86400
+                # Las filas que el backfill de viewer_stats aún no suma no se archivan
+                channels = [] if self.db.stats_backfill_running else self.db.get_history_channels()
+                for history_channel in channels:
+                    while self.running and not any(channel.is_live for channel in self.channels.values()):
+                        count = self.db.archive_history_batch(history_channel, cutoff)
+                        archived += count
+                        if count < ARCHIVE_BATCH_SIZE:
+                            break
+                        time.sleep(ARCHIVE_BATCH_PAUSE)
+                
+                if archived:
+                    self.add_log(f'📦 {archived} filas del historial archivadas en {ARCHIVE_DIR}', level='info', event='archive')
+                    
+            except Exception as e:
+                self.add_log(f'❌ Error en archive_loop: {e}', level='error', event='archive')
+            
+            time.sleep(ARCHIVE_INTERVAL)
     
     def monitor_loop(self):
         """Loop de monitoreo API polling"""
-        self.add_log('🔄 Iniciando monitoreo API polling...')
+        self.add_log('🔄 Iniciando monitoreo API polling...', level='info', event='startup')
+        last_optimize = time.time()
         
         while self.running:
             try:
@@ -498,64 +3534,288 @@ class TwitchTracker:
                 time.sleep(60)
                 
                 if self.running:
-                    current_time = time.time()
+                    total_polls = sum(channel.total_polls for channel in self.channels.values())
+                    successful_polls = sum(channel.successful_polls for channel in self.channels.values())
+                    success_rate = (successful_polls / total_polls * 100) if total_polls > 0 else 0
                     
-                    # Estado del polling
-                    time_since_last_poll = current_time - self.last_poll_time if self.last_poll_time else 0
-                    success_rate = (self.successful_polls / self.total_polls * 100) if self.total_polls > 0 else 0
+                    self.add_log(f'📊 API Polling: {total_polls} polls totales en {len(self.channels)} canales', level='info', event='stats')
+                    self.add_log(f'✅ Tasa de éxito: {success_rate:.1f}%', level='info', event='stats')
+                    rate_limit = self.rate_limiter.snapshot()
+                    self.add_log(f'📈 Rate limit restante: {rate_limit["tokens"]}/{rate_limit["capacity"]}', level='info', event='rate_limit')
+                    helix_stats = self.helix.get_stats()
+                    self.add_log(f'🌐 Helix: {helix_stats["avg_latency_ms"]}ms promedio, {helix_stats["total_retries"]} reintentos', level='info', event='helix')
+                    if self.irc:
+                        irc_status = self.irc.get_status()
+                        self.add_log(
+                            f'📡 IRC: {"conectado" if irc_status["connected"] else "desconectado"}, '
+                            f'{irc_status["events_received"]} eventos, {irc_status["reconnects"]} reconexiones',
+                            level='info', event='irc'
+                        )
                     
-                    self.add_log(f'📊 API Polling: {self.total_polls} polls totales')
-                    self.add_log(f'✅ Tasa de éxito: {success_rate:.1f}%')
-                    self.add_log(f'⏰ Último poll: {int(time_since_last_poll)}s atrás')
-                    self.add_log(f'🔄 Próximo poll en: {self.poll_interval}s')
-                    self.add_log(f'📈 Rate limit restante: {self.rate_limit_remaining}')
+                    # Checkpoint periódico por si el proceso muere sin SIGTERM
+                    self.checkpoint()
                     
-                    # Estado de usuarios
-                    self.add_log(f'📈 Usuarios actuales: {len(current_viewers)}')
-                    self.add_log(f'📋 Historial total: {len(all_history)} entradas')
-                    self.add_log(f'👥 Usuarios en chat: {len(self.current_users)}')
+                    # Mantener al día las estadísticas del planner a medida que crece el historial
+                    if time.time() - last_optimize >= DB_OPTIMIZE_INTERVAL:
+                        last_optimize = time.time()
+                        self.db.optimize()
                     
-                    # Mostrar usuarios recientes
-                    if len(current_viewers) > 0:
-                        recent_users = list(current_viewers.keys())[-3:]
-                        self.add_log(f'👥 Usuarios recientes: {", ".join(recent_users)}')
-                    else:
-                        self.add_log('💤 Esperando usuarios...')
+                    # Estado de usuarios por canal
+                    for channel in self.channels.values():
+                        time_since_last_poll = int(time.time() - channel.last_poll_time) if channel.last_poll_time else 0
+                        channel.add_log(
+                            f'👥 {len(channel.current_viewers)} viendo, {channel.total_left} en historial, '
+                            f'último poll hace {time_since_last_poll}s',
+                            level='info', event='viewers'
+                        )
                 
             except Exception as e:
-                self.add_log(f'❌ Error en monitor_loop: {e}')
+                self.add_log(f'❌ Error en monitor_loop: {e}', level='error', event='stats')
                 time.sleep(30)
     
 
-def get_santiago_time() -> str:
-    """Obtiene la hora actual en Santiago, Chile"""
-    now = datetime.now(SANTIAGO_TZ)
-    return now.strftime('%d-%m-%y %H:%M:%S')
+def get_santiago_time() -> str:
+    """Obtiene la hora actual en Santiago, Chile"""
+    now = datetime.now(SANTIAGO_TZ)
+    return now.strftime('%d-%m-%y %H:%M:%S')
+
+def format_santiago_time(timestamp) -> str:
+    """Formatea un epoch como hora de Santiago ('dd-mm-yy HH:MM:SS')"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, SANTIAGO_TZ).strftime('%d-%m-%y %H:%M:%S')
+
+def parse_santiago_time(text):
+    """Convierte 'dd-mm-yy HH:MM:SS' en hora de Santiago a epoch (None si no es válido)"""
+    if not text:
+        return None
+    try:
+        naive = datetime.strptime(text, '%d-%m-%y %H:%M:%S')
+        return int(SANTIAGO_TZ.localize(naive).timestamp())
+    except ValueError:
+        return None
+
+def parse_time_bound(value):
+    """Convierte un límite de tiempo (epoch o ISO 8601) a epoch
+
+    Las fechas ISO sin zona horaria se interpretan en hora de Santiago.
+    Lanza ValueError si el formato no es válido.
+    """
+    value = value.strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'fecha inválida: {value}')
+    if parsed.tzinfo is None:
+        parsed = SANTIAGO_TZ.localize(parsed)
+    return int(parsed.timestamp())
+
+def santiago_day_range(text):
+    """Convierte un día 'dd-mm-yy' al rango de epochs [inicio, inicio del día siguiente)"""
+    try:
+        day = datetime.strptime(text, '%d-%m-%y')
+    except ValueError:
+        raise ValueError(f'fecha inválida: {text}')
+    # Se localiza cada medianoche por separado para respetar los cambios de horario
+    start = SANTIAGO_TZ.localize(day)
+    end = SANTIAGO_TZ.localize(day + timedelta(days=1))
+    return int(start.timestamp()), int(end.timestamp())
+
+STATS_PERIOD_PATTERN = re.compile(r'^\d{4}-(\d{2}|W\d{2}|\d{2}-\d{2})$')
+
+def stats_periods(timestamp):
+    """Períodos de viewer_stats a los que suma una salida: total, mes, semana ISO y día"""
+    moment = datetime.fromtimestamp(timestamp, SANTIAGO_TZ)
+    year, week, _ = moment.isocalendar()
+    return ('all', moment.strftime('%Y-%m'), f'{year}-W{week:02d}', moment.strftime('%Y-%m-%d'))
+
+def resolve_stats_period(text):
+    """Convierte ?period= (all|month|week|day o una clave como '2026-10') en la clave de viewer_stats"""
+    text = (text or 'all').strip().lower()
+    current = stats_periods(time.time())
+    if text in ('all', 'month', 'week', 'day'):
+        return current[('all', 'month', 'week', 'day').index(text)]
+    
+    text = text.upper() if 'w' in text else text
+    if not STATS_PERIOD_PATTERN.match(text):
+        raise ValueError(f'período inválido: {text}')
+    return text
+
+def rollup_buckets(timestamp):
+    """Inicio de los buckets de minuto, hora y día (medianoche de Santiago) de un epoch"""
+    midnight = datetime.fromtimestamp(timestamp, SANTIAGO_TZ).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    return (
+        ('minute', timestamp - timestamp % 60),
+        ('hour', timestamp - timestamp % 3600),
+        ('day', int(SANTIAGO_TZ.localize(midnight).timestamp()))
+    )
+
+def choose_series_resolution(since, until, now):
+    """Nivel más fino que conserva el rango y no supera TIMESERIES_MAX_ROWS filas"""
+    for resolution, step in TIMESERIES_RESOLUTIONS.items():
+        retention = TIMESERIES_RETENTION[resolution]
+        if retention is not None and since < now - retention:
+            continue
+        if (until - since) / (step or POLL_MIN_INTERVAL) <= TIMESERIES_MAX_ROWS:
+            return resolution
+    return 'day'
+
+def downsample_lttb(points, threshold, key='chatters'):
+    """Reduce una serie a `threshold` puntos con Largest-Triangle-Three-Buckets
+
+    Conserva el primer y el último punto y, en cada bucket intermedio, el
+    punto que forma el triángulo más grande con el elegido antes y el
+    promedio del bucket siguiente, para mantener picos y valles.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return points
+    
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    selected = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[end:next_end] or [points[-1]]
+        avg_x = sum(point['ts'] for point in next_bucket) / len(next_bucket)
+        avg_y = sum(point[key] or 0 for point in next_bucket) / len(next_bucket)
+        
+        selected_x, selected_y = points[selected]['ts'], points[selected][key] or 0
+        best_area = -1
+        best = start
+        for j in range(start, end):
+            area = abs(
+                (selected_x - avg_x) * ((points[j][key] or 0) - selected_y)
+                - (selected_x - points[j]['ts']) * (avg_y - selected_y)
+            )
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        selected = best
+    
+    sampled.append(points[-1])
+    return sampled
+
+def archive_month(timestamp):
+    """Mes ('AAAA-MM', hora de Santiago) del archivo de historial de un epoch"""
+    return datetime.fromtimestamp(timestamp, SANTIAGO_TZ).strftime('%Y-%m')
 
-def calculate_duration(start_time: str, end_time: str) -> str:
-    """Calcula la duración entre dos timestamps"""
-    start = datetime.strptime(start_time, '%d-%m-%y %H:%M:%S')
-    end = datetime.strptime(end_time, '%d-%m-%y %H:%M:%S')
+def username_matcher(username, match='contains'):
+    """Predicado equivalente a username_filter_clause para filas archivadas"""
+    if not username:
+        return lambda candidate: True
     
-    duration = end - start
-    hours = int(duration.total_seconds() // 3600)
-    minutes = int((duration.total_seconds() % 3600) // 60)
-    seconds = int(duration.total_seconds() % 60)
-    
-    return f"{hours}h {minutes}m {seconds}s"
+    wanted = username.casefold()
+    if match == 'exact':
+        return lambda candidate: candidate.casefold() == wanted
+    if match == 'prefix':
+        return lambda candidate: candidate.casefold().startswith(wanted)
+    return lambda candidate: wanted in candidate.casefold()
+
+def format_duration(seconds) -> str:
+    """Formatea una duración en segundos como 'Xh Ym Zs'"""
+    if seconds is None:
+        return None
+    seconds = int(seconds)
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    return f"{hours}h {minutes}m {seconds % 60}s"
+
+DURATION_PATTERN = re.compile(r'^\s*(\d+)h\s+(\d+)m\s+(\d+)s\s*$')
+
+def parse_duration(text):
+    """Convierte 'Xh Ym Zs' a segundos (None si no es válido)"""
+    match = DURATION_PATTERN.match(text or '')
+    if not match:
+        return None
+    hours, minutes, seconds = (int(part) for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+def encode_history_cursor(timestamp, row_id) -> str:
+    """Codifica la posición (timestamp, id) como cursor opaco"""
+    raw = f"{timestamp}:{row_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor: str):
+    """Decodifica un cursor de historial; lanza ValueError si no es válido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        return int(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('cursor inválido')
+
+def recent_entries(buffer, limit, offset=0) -> List[Dict]:
+    """Últimos `limit` elementos de un deque saltando `offset` desde el final, en orden"""
+    newest_first = itertools.islice(reversed(buffer), offset, offset + limit)
+    return list(newest_first)[::-1]
+
+def parse_window_args():
+    """Lee limit/offset de la ventana de /api/salieron y /api/historial"""
+    try:
+        limit = min(max(int(request.args.get('limit', RECENT_WINDOW_DEFAULT)), 1), HISTORY_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        raise ValueError('limit y offset deben ser números enteros')
+    if offset > RECENT_MAX_OFFSET:
+        raise ValueError(f'offset máximo {RECENT_MAX_OFFSET}; para ir más atrás usa /api/history con cursor')
+    return limit, offset
+
+def format_change_row(row) -> Dict:
+    """Convierte una fila de change_log en el formato de /api/changes"""
+    seq, channel, event, login, username, ts, duration_seconds = row
+    change = {
+        'seq': seq,
+        'channel': channel,
+        'event': event,
+        'login': login,
+        'username': username,
+        'ts': ts,
+        'time': format_santiago_time(ts)
+    }
+    if event == 'leave':
+        change['duration_seconds'] = duration_seconds
+        change['duration'] = format_duration(duration_seconds)
+    return change
+
+def format_history_row(row) -> Dict:
+    """Convierte una fila de user_history a su forma de respuesta con textos derivados"""
+    row_id, username, action, join_ts, leave_ts, duration_seconds, timestamp = row
+    return {
+        'id': row_id,
+        'username': username,
+        'action': action,
+        'join_time': format_santiago_time(join_ts),
+        'leave_time': format_santiago_time(leave_ts),
+        'duration': format_duration(duration_seconds),
+        'date_created': format_santiago_time(timestamp),
+        'timestamp': timestamp,
+        'join_ts': join_ts,
+        'leave_ts': leave_ts,
+        'duration_seconds': duration_seconds
+    }
 
 
 # Rutas de la API
 @app.route('/')
 def dashboard():
     """Dashboard principal"""
+    channel = get_requested_channel() or tracker_manager.get_channel()
     return render_template_string('''
     <!DOCTYPE html>
     <html lang="es">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Twitch Viewer Tracker - Blackcraneo</title>
+        <title>Twitch Viewer Tracker - {{ channel }}</title>
         <style>
             * {
                 margin: 0;
@@ -912,11 +4172,19 @@ def dashboard():
             </div>
             
             <div class="header">
-                <h2>Canal: Blackcraneo</h2>
+                <h2>Canal: {{ channel }}</h2>
             </div>
         </div>
         
         <script>
+            // Canal mostrado en el dashboard (?channel= en la URL)
+            const CHANNEL = {{ channel|tojson }};
+            
+            function apiUrl(path, params = {}) {
+                const query = new URLSearchParams({ channel: CHANNEL, ...params });
+                return `${path}?${query.toString()}`;
+            }
+            
             function updateTime() {
                 const now = new Date();
                 const santiagoTime = new Intl.DateTimeFormat('es-CL', {
@@ -931,151 +4199,131 @@ def dashboard():
                 document.getElementById('current-time').textContent = santiagoTime;
             }
             
-            function updateStats() {
-                fetch('/api/stats')
-                    .then(response => response.json())
-                    .then(data => {
-                        document.getElementById('espectadores').textContent = data.espectadores;
-                    });
+            function renderStats(data) {
+                document.getElementById('espectadores').textContent = data.espectadores;
             }
             
-            function updateViendo() {
-                fetch('/api/viendo')
-                    .then(response => response.json())
-                    .then(data => {
-                        const list = document.getElementById('viendo-list');
-                        list.innerHTML = '';
-                        
-                        if (data.users.length === 0) {
-                            list.innerHTML = '<div class="empty-message">En espera de usuarios</div>';
-                            return;
-                        }
-                        
-                        data.users.slice(0, 10).forEach(user => {
-                            const item = document.createElement('div');
-                            item.className = 'user-item-compact status-viendo';
-                            item.innerHTML = `
-                                <div>
-                                    <div class="user-name">${user.username}</div>
-                                    <div class="user-time">Entró: ${user.join_time}</div>
-                                </div>
-                                <div class="pulse">🟢</div>
-                            `;
-                            list.appendChild(item);
-                        });
-                    });
+            function renderViendo(users) {
+                const list = document.getElementById('viendo-list');
+                list.innerHTML = '';
+                
+                if (users.length === 0) {
+                    list.innerHTML = '<div class="empty-message">En espera de usuarios</div>';
+                    return;
+                }
+                
+                users.slice(0, 10).forEach(user => {
+                    const item = document.createElement('div');
+                    item.className = 'user-item-compact status-viendo';
+                    item.innerHTML = `
+                        <div>
+                            <div class="user-name">${user.username}</div>
+                            <div class="user-time">Entró: ${user.join_time}</div>
+                        </div>
+                        <div class="pulse">🟢</div>
+                    `;
+                    list.appendChild(item);
+                });
             }
             
-            function updateSalieron() {
-                fetch('/api/salieron')
-                    .then(response => response.json())
-                    .then(data => {
-                        const list = document.getElementById('salieron-list');
-                        list.innerHTML = '';
-                        
-                        if (data.users.length === 0) {
-                            list.innerHTML = '<div class="empty-message">En espera de usuarios</div>';
-                            return;
-                        }
-                        
-                        data.users.slice(-10).reverse().forEach(user => {
-                            const item = document.createElement('div');
-                            item.className = 'user-item-compact status-salió';
-                            item.innerHTML = `
-                                <div>
-                                    <div class="user-name">${user.username}</div>
-                                    <div class="user-time">Salió: ${user.leave_time}</div>
-                                    ${user.duration ? `<div class="user-duration">Estuvo: ${user.duration}</div>` : ''}
-                                </div>
-                                <div>🔴</div>
-                            `;
-                            list.appendChild(item);
-                        });
-                    });
+            function renderSalieron(users) {
+                const list = document.getElementById('salieron-list');
+                list.innerHTML = '';
+                
+                if (users.length === 0) {
+                    list.innerHTML = '<div class="empty-message">En espera de usuarios</div>';
+                    return;
+                }
+                
+                users.slice(-10).reverse().forEach(user => {
+                    const item = document.createElement('div');
+                    item.className = 'user-item-compact status-salió';
+                    item.innerHTML = `
+                        <div>
+                            <div class="user-name">${user.username}</div>
+                            <div class="user-time">Salió: ${user.leave_time}</div>
+                            ${user.duration ? `<div class="user-duration">Estuvo: ${user.duration}</div>` : ''}
+                        </div>
+                        <div>🔴</div>
+                    `;
+                    list.appendChild(item);
+                });
             }
             
-            function updateHistorial() {
-                fetch('/api/historial')
-                    .then(response => response.json())
-                    .then(data => {
-                        const list = document.getElementById('historial-list');
-                        list.innerHTML = '';
-                        
-                        if (data.history.length === 0) {
-                            list.innerHTML = '<div class="empty-message">Aún no hay historial</div>';
-                            return;
-                        }
-                        
-                        data.history.slice(-20).reverse().forEach(entry => {
-                            const item = document.createElement('div');
-                            item.className = `user-item status-${entry.status}`;
-                            
-                            let actionText = '';
-                            let icon = '';
-                            if (entry.action === 'entró') {
-                                actionText = `Entró: ${entry.join_time}`;
-                                icon = '🟢';
-                            } else if (entry.action === 'salió') {
-                                actionText = `Salió: ${entry.leave_time}`;
-                                icon = '🔴';
-                             } else if (entry.action === 'ya estaba') {
-                                 actionText = `Ya estaba: ${entry.join_time}`;
-                                 icon = '🔵';
-                             } else if (entry.action === 'detectado por chat') {
-                                 actionText = `Detectado por chat: ${entry.join_time}`;
-                                 icon = '💬';
-                             } else if (entry.action === 'detectado por follow') {
-                                 actionText = `Detectado por follow: ${entry.join_time}`;
-                                 icon = '👥';
-                             } else if (entry.action === 'detectado por estado') {
-                                 actionText = `Detectado por estado: ${entry.join_time}`;
-                                 icon = '👤';
-                             } else if (entry.action === 'detectado periódicamente') {
-                                 actionText = `Detectado periódicamente: ${entry.join_time}`;
-                                 icon = '🔄';
-                             } else if (entry.action === 'detectado activo') {
-                                 actionText = `Detectado activo: ${entry.join_time}`;
-                                 icon = '👁️';
-                             }
-                            
-                            item.innerHTML = `
-                                <div>
-                                    <div class="user-name">${entry.username}</div>
-                                    <div class="user-time">${actionText}</div>
-                                    ${entry.duration ? `<div class="user-duration">Estuvo: ${entry.duration}</div>` : ''}
-                                </div>
-                                <div>${icon}</div>
-                            `;
-                            list.appendChild(item);
-                        });
-                    });
+            function renderHistorial(history) {
+                const list = document.getElementById('historial-list');
+                list.innerHTML = '';
+                
+                if (history.length === 0) {
+                    list.innerHTML = '<div class="empty-message">Aún no hay historial</div>';
+                    return;
+                }
+                
+                history.slice(-20).reverse().forEach(entry => {
+                    const item = document.createElement('div');
+                    item.className = `user-item status-${entry.status}`;
+                    
+                    let actionText = '';
+                    let icon = '';
+                    if (entry.action === 'entró') {
+                        actionText = `Entró: ${entry.join_time}`;
+                        icon = '🟢';
+                    } else if (entry.action === 'salió') {
+                        actionText = `Salió: ${entry.leave_time}`;
+                        icon = '🔴';
+                     } else if (entry.action === 'ya estaba') {
+                         actionText = `Ya estaba: ${entry.join_time}`;
+                         icon = '🔵';
+                     } else if (entry.action === 'detectado por chat') {
+                         actionText = `Detectado por chat: ${entry.join_time}`;
+                         icon = '💬';
+                     } else if (entry.action === 'detectado por follow') {
+                         actionText = `Detectado por follow: ${entry.join_time}`;
+                         icon = '👥';
+                     } else if (entry.action === 'detectado por estado') {
+                         actionText = `Detectado por estado: ${entry.join_time}`;
+                         icon = '👤';
+                     } else if (entry.action === 'detectado periódicamente') {
+                         actionText = `Detectado periódicamente: ${entry.join_time}`;
+                         icon = '🔄';
+                     } else if (entry.action === 'detectado activo') {
+                         actionText = `Detectado activo: ${entry.join_time}`;
+                         icon = '👁️';
+                     }
+                    
+                    item.innerHTML = `
+                        <div>
+                            <div class="user-name">${entry.username}</div>
+                            <div class="user-time">${actionText}</div>
+                            ${entry.duration ? `<div class="user-duration">Estuvo: ${entry.duration}</div>` : ''}
+                        </div>
+                        <div>${icon}</div>
+                    `;
+                    list.appendChild(item);
+                });
             }
             
-            function updateLogs() {
-                fetch('/api/logs')
-                    .then(response => response.json())
-                    .then(data => {
-                        const list = document.getElementById('logs-list');
-                        list.innerHTML = '';
-                        
-                        if (data.logs.length === 0) {
-                            list.innerHTML = '<div class="empty-message">No hay logs disponibles</div>';
-                            return;
-                        }
-                        
-                        data.logs.slice(-15).reverse().forEach(log => {
-                            const item = document.createElement('div');
-                            item.className = 'user-item';
-                            item.style.fontSize = '0.7em';
-                            item.style.padding = '2px 4px';
-                            item.innerHTML = `<div style="color: #ffaaaa; font-family: monospace;">${log}</div>`;
-                            list.appendChild(item);
-                        });
-                    });
+            function renderLogs(logs) {
+                const list = document.getElementById('logs-list');
+                list.innerHTML = '';
+                
+                if (logs.length === 0) {
+                    list.innerHTML = '<div class="empty-message">No hay logs disponibles</div>';
+                    return;
+                }
+                
+                logs.slice(-15).reverse().forEach(log => {
+                    const item = document.createElement('div');
+                    item.className = 'user-item';
+                    item.style.fontSize = '0.7em';
+                    item.style.padding = '2px 4px';
+                    item.innerHTML = `<div style="color: #ffaaaa; font-family: monospace;">${log}</div>`;
+                    list.appendChild(item);
+                });
             }
-
+            
             function loadHistoryWithFilters(username = '', date = '') {
-                const url = `/api/history?username=${encodeURIComponent(username)}&date=${encodeURIComponent(date)}&limit=100`;
+                const url = apiUrl('/api/history', { username: username, date: date, limit: 100 });
                 
                 fetch(url)
                     .then(response => response.json())
@@ -1209,12 +4457,10 @@ def dashboard():
                 });
             });
             
-            // Actualizar lista de usernames cada 10 segundos
-            setInterval(updateAutocomplete, 10000);
             updateAutocomplete();
 
             function loadCurrentUsers() {
-                fetch('/api/current-users')
+                fetch(apiUrl('/api/current-users'))
                     .then(response => response.json())
                     .then(data => {
                         const viendoList = document.getElementById('viendo-list');
@@ -1235,58 +4481,170 @@ def dashboard():
                     .catch(error => console.error('Error cargando usuarios actuales:', error));
             }
             
-             // Actualizar cada 3 segundos (más responsivo)
-             setInterval(updateTime, 1000);
-             setInterval(updateStats, 3000);  // Estadísticas cada 3 segundos
-             setInterval(updateViendo, 3000); // Viendo cada 3 segundos
-             setInterval(updateSalieron, 3000); // Salieron cada 3 segundos
-             setInterval(updateHistorial, 3000); // Historial cada 3 segundos
-             setInterval(updateLogs, 3000); // Logs cada 3 segundos
-             
-             // Cargar datos iniciales
-             loadHistoryWithFilters();
-             loadCurrentUsers();
+            // Polling cada 3 segundos: solo si SSE no está disponible
+            let pollingStarted = false;
+            function startPolling() {
+                if (pollingStarted) return;
+                pollingStarted = true;
+                
+                setInterval(updateSnapshot, 3000); // Todo el estado cada 3 segundos
+                setInterval(updateAutocomplete, 10000); // Usernames cada 10 segundos
+                
+                updateSnapshot();
+            }
+            
+            // El navegador revalida con If-None-Match: sin cambios recibe un 304
+            let snapshotVersion = null;
+            function updateSnapshot() {
+                fetch(apiUrl('/api/snapshot'))
+                    .then(response => response.json())
+                    .then(data => {
+                        if (data.version === snapshotVersion) return;
+                        snapshotVersion = data.version;
+                        renderStats(data.stats);
+                        renderViendo(data.viendo);
+                        renderSalieron(data.salieron);
+                        renderHistorial(data.historial);
+                        renderLogs(data.logs);
+                    });
+            }
+            
+            // Estado mantenido con los eventos de /api/events
+            const live = { viendo: new Map(), salieron: [], historial: [], logs: [] };
+            let autocompleteTimer = null;
+            
+            function keepLast(list, item, max) {
+                list.push(item);
+                if (list.length > max) list.splice(0, list.length - max);
+            }
+            
+            function connectEvents() {
+                if (!window.EventSource) {
+                    startPolling();
+                    return;
+                }
+                
+                // El navegador reconecta solo y envía Last-Event-ID para reanudar
+                const source = new EventSource(apiUrl('/api/events'));
+                let opened = false;
+                
+                source.addEventListener('snapshot', event => {
+                    opened = true;
+                    const data = JSON.parse(event.data);
+                    live.viendo = new Map(data.viendo.map(user => [user.login, user]));
+                    live.salieron = data.salieron;
+                    live.historial = data.historial;
+                    live.logs = data.logs;
+                    renderStats(data.stats);
+                    renderViendo([...live.viendo.values()]);
+                    renderSalieron(live.salieron);
+                    renderHistorial(live.historial);
+                    renderLogs(live.logs);
+                });
+                
+                source.addEventListener('join', event => {
+                    const user = JSON.parse(event.data);
+                    live.viendo.set(user.login, user);
+                    renderViendo([...live.viendo.values()]);
+                });
+                
+                source.addEventListener('leave', event => {
+                    const entry = JSON.parse(event.data);
+                    live.viendo.delete(entry.login);
+                    keepLast(live.salieron, entry, 10);
+                    keepLast(live.historial, entry, 20);
+                    renderViendo([...live.viendo.values()]);
+                    renderSalieron(live.salieron);
+                    renderHistorial(live.historial);
+                    
+                    // Las salidas agregan usernames nuevos: refrescar el autocompletado sin saturar
+                    if (!autocompleteTimer) {
+                        autocompleteTimer = setTimeout(() => {
+                            autocompleteTimer = null;
+                            updateAutocomplete();
+                        }, 10000);
+                    }
+                });
+                
+                source.addEventListener('stats', event => renderStats(JSON.parse(event.data)));
+                
+                source.addEventListener('log', event => {
+                    keepLast(live.logs, JSON.parse(event.data).text, 15);
+                    renderLogs(live.logs);
+                });
+                
+                source.onerror = () => {
+                    // Sin conexión inicial o rechazada por el servidor: volver al polling
+                    if (!opened || source.readyState === EventSource.CLOSED) {
+                        source.close();
+                        startPolling();
+                    }
+                };
+            }
+            
+            setInterval(updateTime, 1000);
             
             // Cargar datos iniciales
+            loadHistoryWithFilters();
+            loadCurrentUsers();
             updateTime();
-            updateStats();
-            updateViendo();
-            updateSalieron();
-            updateHistorial();
-            updateLogs();
+            connectEvents();
         </script>
     </body>
     </html>
-    ''')
+    ''', channel=channel.channel_name)
+
+def get_requested_channel():
+    """Obtiene el tracker del canal pedido en ?channel= (o el del canal por defecto)"""
+    return tracker_manager.get_channel(request.args.get('channel'))
+
+def channel_not_found():
+    """Respuesta para canales que no se están trackeando"""
+    return jsonify({
+        'status': 'error',
+        'error': f"canal no trackeado: {request.args.get('channel')}",
+        'channels': list(tracker_manager.channels),
+        'timestamp': get_santiago_time()
+    }), 404
+
+@app.route('/api/channels')
+def get_channels():
+    """Lista los canales trackeados"""
+    return jsonify({
+        'channels': list(tracker_manager.channels),
+        'default_channel': DEFAULT_CHANNEL,
+        'timestamp': get_santiago_time()
+    })
 
 @app.route('/api/stats')
 def get_stats():
     """Obtiene estadísticas generales"""
-    espectadores = len(current_viewers)
-    viendo = len(current_viewers)
-    salieron = len(left_viewers)
-    total_historial = len(all_history)
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
     
     return jsonify({
-        'espectadores': espectadores,
-        'viendo': viendo,
-        'salieron': salieron,
-        'total_historial': total_historial,
+        **channel.get_stats(),
         'timestamp': get_santiago_time()
     })
 
 @app.route('/api/viendo')
 def get_viendo():
     """Obtiene usuarios que están viendo actualmente"""
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
     users = []
-    for username, user_data in current_viewers.items():
+    for user_data in channel.get_viewers():
         users.append({
-            'username': username,
+            'username': user_data['username'],
             'join_time': user_data['join_time'],
             'current_time': get_santiago_time()
         })
     
     return jsonify({
+        'channel': channel.channel_name,
         'count': len(users),
         'users': users,
         'timestamp': get_santiago_time()
@@ -1294,51 +4652,326 @@ def get_viendo():
 
 @app.route('/api/salieron')
 def get_salieron():
-    """Obtiene usuarios que salieron"""
+    """Obtiene las últimas salidas (?limit=, ?offset= desde la más reciente)"""
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    try:
+        limit, offset = parse_window_args()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        }), 400
+    
+    users = channel.get_recent_leaves(limit, offset)
+    
     return jsonify({
-        'count': len(left_viewers),
-        'users': left_viewers,
+        'channel': channel.channel_name,
+        'count': len(users),
+        'total': channel.total_left,
+        'limit': limit,
+        'offset': offset,
+        'users': users,
         'timestamp': get_santiago_time()
     })
 
 @app.route('/api/historial')
 def get_historial():
-    """Obtiene el historial completo"""
+    """Obtiene las últimas entradas del historial (?limit=, ?offset= desde la más reciente)"""
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    try:
+        limit, offset = parse_window_args()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        }), 400
+    
+    history = channel.get_recent_leaves(limit, offset, history=True)
+    
     return jsonify({
-        'count': len(all_history),
-        'history': all_history,
+        'channel': channel.channel_name,
+        'count': len(history),
+        'total': channel.total_left,
+        'limit': limit,
+        'offset': offset,
+        'history': history,
         'timestamp': get_santiago_time()
     })
 
 @app.route('/api/logs')
 def get_logs():
-    """Obtiene los logs del tracker"""
+    """Obtiene los logs del tracker (?since=<id> solo los nuevos, ?level=warning|error, ?channel=)"""
+    level = request.args.get('level')
+    if level is not None and level not in LOG_LEVELS:
+        return jsonify({
+            'status': 'error',
+            'error': f'level debe ser uno de: {", ".join(LOG_LEVELS)}',
+            'timestamp': get_santiago_time()
+        }), 400
+    
+    # Un id de otro worker no se puede comparar con los de este: se reenvían los últimos (resync)
+    since_param = request.args.get('since')
+    since = parse_process_id(since_param)
+    resync = bool(since_param) and since is None
+    
+    channel = request.args.get('channel')
+    logs = tracker_manager.get_logs(
+        since=since,
+        level=level,
+        channel=channel.strip().lower() if channel else None,
+        limit=None if since is not None else LOG_RESPONSE_DEFAULT
+    )
+    
     return jsonify({
-        'logs': tracker.logs,
-        'count': len(tracker.logs),
+        'logs': [{**record, 'id': format_process_id(record['id'])} for record in logs],
+        'count': len(logs),
+        'last_id': format_process_id(logs[-1]['id'] if logs else (since or tracker_manager.log_id)),
+        'resync': resync,
         'timestamp': get_santiago_time()
     })
 
+sse_clients = 0
+sse_clients_lock = threading.Lock()
+
+def format_sse(event_id, event, data):
+    """Serializa un evento en formato text/event-stream"""
+    return f"id: {format_process_id(event_id)}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/events')
+def events_endpoint():
+    """Stream SSE con entradas, salidas, estadísticas y logs del canal
+
+    Al conectarse se envía un evento 'snapshot' con el estado completo; al
+    reconectar con Last-Event-ID se reenvían solo los eventos perdidos (o un
+    snapshot nuevo si ya no están en el buffer).
+    """
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    # El cupo se reserva aquí (no al empezar el stream) para que dos pedidos
+    # simultáneos no pasen ambos el límite; se libera al cerrar la respuesta
+    global sse_clients
+    with sse_clients_lock:
+        if sse_clients >= SSE_MAX_CLIENTS:
+            return jsonify({
+                'status': 'error',
+                'error': 'Demasiadas conexiones SSE, usa polling',
+                'timestamp': get_santiago_time()
+            }), 503
+        sse_clients += 1
+    
+    # Un Last-Event-ID de otro worker (o de antes de un reinicio) recibe un snapshot nuevo
+    last_id = parse_process_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    bus = tracker_manager.events
+    channel_name = channel.channel_name
+    
+    def generate():
+        nonlocal last_id
+        
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        
+        missed = bus.events_after(last_id) if last_id is not None else None
+        if missed is None:
+            snapshot, last_id = channel.get_snapshot()
+            snapshot['logs'] = tracker_manager.get_log_lines(15, channel.channel_name)
+            yield format_sse(last_id, 'snapshot', snapshot)
+            missed = bus.events_after(last_id) or []
+        
+        deadline = time.time() + SSE_MAX_DURATION
+        while time.time() < deadline:
+            for event_id, event, event_channel, data in missed:
+                last_id = event_id
+                if event_channel in (None, channel_name):
+                    yield format_sse(event_id, event, data)
+            
+            if not bus.wait(last_id, SSE_KEEPALIVE):
+                yield ': keep-alive\n\n'
+            missed = bus.events_after(last_id)
+            if missed is None:
+                # El cliente quedó demasiado atrás: que reconecte y reciba un snapshot
+                break
+    
+    def release_slot():
+        global sse_clients
+        with sse_clients_lock:
+            sse_clients -= 1
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(release_slot)
+    return response
+
+snapshot_cache: Dict[str, tuple] = {}  # canal -> (versión, JSON serializado)
+snapshot_cache_lock = threading.Lock()
+
+def get_snapshot_body(channel):
+    """JSON del snapshot del canal, serializado una vez por versión del canal
+
+    La versión es el id del último evento del canal o global (logs sin
+    canal), así la actividad de otros canales no invalida el caché ni el ETag.
+    """
+    version = tracker_manager.events.channel_version(channel.channel_name)
+    cached = snapshot_cache.get(channel.channel_name)
+    if cached and cached[0] == version:
+        return cached
+    
+    with snapshot_cache_lock:
+        # Otro hilo pudo construirlo mientras esperábamos el lock
+        version = tracker_manager.events.channel_version(channel.channel_name)
+        cached = snapshot_cache.get(channel.channel_name)
+        if cached and cached[0] == version:
+            return cached
+        
+        snapshot, _ = channel.get_snapshot()
+        snapshot['logs'] = tracker_manager.get_log_lines(15, channel.channel_name)
+        snapshot['version'] = format_process_id(version)
+        snapshot['timestamp'] = get_santiago_time()
+        
+        cached = (version, json.dumps(snapshot, ensure_ascii=False))
+        snapshot_cache[channel.channel_name] = cached
+        return cached
+
+@app.route('/api/snapshot')
+def snapshot_endpoint():
+    """Estadísticas, usuarios viendo, salidas, historial y logs en una sola respuesta
+
+    La versión del tracker se usa como ETag: si el cliente ya tiene la versión
+    actual recibe un 304 sin cuerpo.
+    """
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    try:
+        version, body = get_snapshot_body(channel)
+        etag = f'{channel.channel_name}-{format_process_id(version)}'
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        }), 500
+
+@app.route('/api/changes')
+def changes_endpoint():
+    """Entradas y salidas posteriores a una secuencia (?since=N)
+
+    Con ?wait=S espera hasta S segundos a que haya cambios (long-poll). Si
+    since es anterior a lo que se conserva se responde resync_required y el
+    cliente debe recargar el estado completo y seguir desde last_seq.
+    """
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    try:
+        since = request.args.get('since')
+        limit = min(max(int(request.args.get('limit', 500)), 1), CHANGES_MAX_PAGE_SIZE)
+        wait = min(max(float(request.args.get('wait', 0)), 0), CHANGES_MAX_WAIT)
+        
+        db = tracker_manager.db
+        if since is None:
+            # Sin secuencia previa: el cliente parte del estado completo
+            return jsonify({
+                'channel': channel.channel_name,
+                'changes': [],
+                'last_seq': db.changes.last_seq,
+                'resync_required': True,
+                'timestamp': get_santiago_time()
+            })
+        
+        since = int(since)
+        deadline = time.time() + wait
+        while True:
+            last_seq = db.changes.last_seq
+            changes, resync = db.get_changes_since(channel.channel_name, since, limit)
+            if changes or resync or time.time() >= deadline:
+                break
+            
+            # Solo hubo cambios de otros canales: seguir esperando desde ahí
+            since = max(since, last_seq)
+            db.changes.wait(since, deadline - time.time())
+        
+        # Con más páginas se sigue desde el último cambio entregado; si no, desde el final del feed
+        has_more = len(changes) >= limit
+        if resync:
+            next_since = last_seq
+        elif has_more:
+            next_since = changes[-1]['seq']
+        else:
+            next_since = max(last_seq, changes[-1]['seq'] if changes else since)
+        
+        return jsonify({
+            'channel': channel.channel_name,
+            'changes': changes,
+            'count': len(changes),
+            'next_since': next_since,
+            'has_more': has_more,
+            'last_seq': last_seq,
+            'resync_required': resync,
+            'timestamp': get_santiago_time()
+        })
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'error': 'since, limit y wait deben ser numéricos',
+            'timestamp': get_santiago_time()
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        }), 500
+
 @app.route('/api/status')
 def status_endpoint():
     """Endpoint para verificar el estado del sistema API"""
     try:
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
+        runtime = tracker_manager.get_runtime_status()
+        rate_limit = runtime['rate_limit']
+        logs = tracker_manager.get_log_lines(10)
+        
         return jsonify({
             'status': 'ok',
-            'tracker_running': tracker.running,
-            'oauth_configured': bool(tracker.oauth_token),
-            'channel_name': tracker.channel_name,
-            'current_viewers_count': len(current_viewers),
-            'total_history_count': len(all_history),
-            'poll_interval': tracker.poll_interval,
-            'total_polls': tracker.total_polls,
-            'successful_polls': tracker.successful_polls,
-            'success_rate': (tracker.successful_polls / tracker.total_polls * 100) if tracker.total_polls > 0 else 0,
-            'rate_limit_remaining': tracker.rate_limit_remaining,
-            'time_since_last_poll': int(time.time() - tracker.last_poll_time) if tracker.last_poll_time else 0,
-            'current_chat_users': len(tracker.current_users),
-            'logs_count': len(tracker.logs),
-            'recent_logs': tracker.logs[-10:] if tracker.logs else [],
+            'tracker_running': runtime['tracker_running'],
+            'tracker_role': runtime['role'],
+            'leader_pid': runtime['leader_pid'],
+            'oauth_configured': bool(tracker_manager.oauth_token),
+            **channel.get_status(),
+            'channels': {name: tracked.get_status() for name, tracked in tracker_manager.channels.items()},
+            'poll_workers': POLL_WORKERS,
+            'ingest_mode': INGEST_MODE,
+            'irc': runtime['irc'],
+            'rate_limit_remaining': rate_limit['tokens'],
+            'rate_limit': rate_limit,
+            'helix': runtime['helix'],
+            'logs_count': len(tracker_manager.logs),
+            'recent_logs': logs,
             'timestamp': get_santiago_time()
         })
     except Exception as e:
@@ -1352,24 +4985,56 @@ def status_endpoint():
 def history_endpoint():
     """Endpoint para obtener historial con filtros"""
     try:
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
         username_filter = request.args.get('username', '').strip()
         date_filter = request.args.get('date', '').strip()
-        limit = int(request.args.get('limit', 100))
+        from_param = request.args.get('from', '').strip()
+        to_param = request.args.get('to', '').strip()
+        match = request.args.get('match', 'contains').strip()
+        limit = max(1, min(int(request.args.get('limit', 100)), HISTORY_MAX_PAGE_SIZE))
+        cursor_param = request.args.get('cursor', '').strip()
+        
+        if match not in ('contains', 'prefix', 'exact'):
+            match = 'contains'
+        
+        cursor = decode_history_cursor(cursor_param) if cursor_param else None
+        
+        # Los límites se convierten una sola vez a epochs para usar el índice
+        since = parse_time_bound(from_param) if from_param else None
+        until = parse_time_bound(to_param) if to_param else None
+        if date_filter:
+            # Compatibilidad con el filtro 'dd-mm-yy' de un día completo
+            day_start, day_end = santiago_day_range(date_filter)
+            since = day_start if since is None else max(since, day_start)
+            until = day_end if until is None else min(until, day_end)
         
         # Obtener historial de la base de datos
-        history = tracker.db.get_user_history(
+        page = tracker_manager.db.get_history_page(
+            channel.channel_name,
             username=username_filter if username_filter else None,
-            date_filter=date_filter if date_filter else None,
-            limit=limit
+            since=since,
+            until=until,
+            limit=limit,
+            match=match,
+            cursor=cursor
         )
+        history = page['history']
         
         return jsonify({
             'status': 'ok',
+            'channel': channel.channel_name,
             'history': history,
             'total_entries': len(history),
+            'next_cursor': page['next_cursor'],
             'filters': {
                 'username': username_filter,
                 'date': date_filter,
+                'from': since,
+                'to': until,
+                'match': match,
                 'limit': limit
             },
             'timestamp': get_santiago_time()
@@ -1381,13 +5046,203 @@ def history_endpoint():
             'timestamp': get_santiago_time()
         })
 
+export_clients = 0
+export_clients_lock = threading.Lock()
+
+def format_export_rows(rows, export_format):
+    """Serializa un lote de filas de historial como NDJSON o CSV"""
+    records = [format_history_row(row) for row in rows]
+    if export_format == 'ndjson':
+        return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([record[column] for column in EXPORT_COLUMNS] for record in records)
+    return buffer.getvalue()
+
+@app.route('/api/export')
+def export_endpoint():
+    """Exporta el historial completo de un canal (?format=ndjson|csv&from=&to=&username=&gzip=1)
+
+    La respuesta se genera por lotes a medida que se leen las filas
+    (transferencia chunked), incluyendo los meses archivados. Con gzip=1
+    se descarga comprimida.
+    """
+    channel = get_requested_channel()
+    if channel is None:
+        return channel_not_found()
+    
+    try:
+        export_format = request.args.get('format', 'ndjson').strip().lower()
+        if export_format not in ('ndjson', 'csv'):
+            raise ValueError(f'formato inválido: {export_format}')
+        
+        username = request.args.get('username', '').strip() or None
+        match = request.args.get('match', 'contains').strip()
+        if match not in ('contains', 'prefix', 'exact'):
+            match = 'contains'
+        from_param = request.args.get('from', '').strip()
+        to_param = request.args.get('to', '').strip()
+        since = parse_time_bound(from_param) if from_param else None
+        until = parse_time_bound(to_param) if to_param else None
+        compress = request.args.get('gzip', '').strip().lower() in ('1', 'true', 'yes')
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        }), 400
+    
+    # El cupo se reserva aquí y se libera al cerrar la respuesta, igual que en /api/events
+    global export_clients
+    with export_clients_lock:
+        if export_clients >= EXPORT_MAX_CONCURRENT:
+            return jsonify({
+                'status': 'error',
+                'error': 'Hay demasiadas exportaciones en curso, intenta más tarde',
+                'timestamp': get_santiago_time()
+            }), 503
+        export_clients += 1
+    
+    db = tracker_manager.db
+    channel_name = channel.channel_name
+    
+    def generate():
+        # wbits=31: formato gzip, para que el archivo se pueda abrir con gunzip
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        try:
+            chunks = itertools.chain(
+                [','.join(EXPORT_COLUMNS) + '\r\n'] if export_format == 'csv' else [],
+                (format_export_rows(rows, export_format)
+                 for rows in db.iter_history(channel_name, username, since, until, match))
+            )
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+            
+            if compressor:
+                yield compressor.flush()
+        except Exception as e:
+            # Los encabezados ya se enviaron: solo queda cortar la descarga
+            print(f"❌ Error exportando historial: {e}")
+    
+    def release_slot():
+        global export_clients
+        with export_clients_lock:
+            export_clients -= 1
+    
+    filename = f'historial-{channel_name}.{export_format}' + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else (
+        'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    )
+    response = Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(release_slot)
+    return response
+
+@app.route('/api/leaderboard')
+def leaderboard_endpoint():
+    """Usuarios con más tiempo visto (?period=all|month|week|day o '2026-10', '2026-W42', '2026-10-17')"""
+    try:
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
+        period = resolve_stats_period(request.args.get('period'))
+        limit = int(request.args.get('limit', LEADERBOARD_DEFAULT))
+        
+        entries = tracker_manager.db.get_leaderboard(channel.channel_name, period, limit)
+        leaderboard = [{
+            'rank': rank,
+            **entry,
+            'watch_time': format_duration(entry['watch_seconds']),
+            'first_seen_time': format_santiago_time(entry['first_seen']),
+            'last_seen_time': format_santiago_time(entry['last_seen'])
+        } for rank, entry in enumerate(entries, 1)]
+        
+        return jsonify({
+            'status': 'ok',
+            'channel': channel.channel_name,
+            'period': period,
+            'leaderboard': leaderboard,
+            'timestamp': get_santiago_time()
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        })
+
+@app.route('/api/timeseries')
+def timeseries_endpoint():
+    """Serie de espectadores de un canal (?from=&to=&resolution=auto|raw|minute|hour|day&points=N)
+
+    Sin resolución se elige el nivel más fino que cubre el rango; la serie
+    se reduce a `points` puntos con LTTB.
+    """
+    try:
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
+        now = int(time.time())
+        from_param = request.args.get('from', '').strip()
+        to_param = request.args.get('to', '').strip()
+        until = parse_time_bound(to_param) if to_param else now + 1
+        since = parse_time_bound(from_param) if from_param else until - 86400
+        resolution = request.args.get('resolution', 'auto').strip().lower()
+        points = min(max(int(request.args.get('points', TIMESERIES_DEFAULT_POINTS)), 3), TIMESERIES_MAX_POINTS)
+        
+        if since >= until:
+            raise ValueError('from debe ser anterior a to')
+        if resolution == 'auto':
+            resolution = choose_series_resolution(since, until, now)
+        elif resolution not in TIMESERIES_RESOLUTIONS:
+            raise ValueError(f'resolución inválida: {resolution}')
+        
+        series = tracker_manager.db.get_viewer_series(channel.channel_name, resolution, since, until)
+        sampled = downsample_lttb(series, points)
+        # La hora legible solo se calcula para los puntos que se devuelven
+        for point in sampled:
+            point['time'] = format_santiago_time(point['ts'])
+        
+        return jsonify({
+            'status': 'ok',
+            'channel': channel.channel_name,
+            'resolution': resolution,
+            'from': since,
+            'to': until,
+            'source_points': len(series),
+            'truncated': len(series) >= TIMESERIES_MAX_ROWS,
+            'points': sampled,
+            'timestamp': get_santiago_time()
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': get_santiago_time()
+        })
+
 @app.route('/api/current-users')
 def current_users_endpoint():
     """Endpoint para obtener usuarios actuales desde la base de datos"""
     try:
-        users = tracker.db.get_current_users()
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
+        users = tracker_manager.db.get_current_users(channel.channel_name)
         return jsonify({
             'status': 'ok',
+            'channel': channel.channel_name,
             'current_users': users,
             'total_users': len(users),
             'timestamp': get_santiago_time()
@@ -1404,11 +5259,7 @@ def all_usernames_endpoint():
     """Endpoint para obtener todos los usernames únicos para autocompletado"""
     try:
         # Obtener usernames únicos de la base de datos
-        with sqlite3.connect(tracker.db.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT DISTINCT username FROM user_history ORDER BY username')
-            results = cursor.fetchall()
-            usernames = [row[0] for row in results]
+        usernames = tracker_manager.db.get_all_usernames()
         
         return jsonify({
             'status': 'ok',
@@ -1425,29 +5276,39 @@ def all_usernames_endpoint():
 
 @app.route('/api/debug')
 def debug_endpoint():
-    """Endpoint de debugging para diagnosticar problemas IRC"""
+    """Endpoint de debugging para diagnosticar problemas del tracker"""
     try:
+        channel = get_requested_channel()
+        if channel is None:
+            return channel_not_found()
+        
+        logs = tracker_manager.get_log_lines(5)
+        runtime = tracker_manager.get_runtime_status()
+        
         return jsonify({
             'debug_info': {
-                'tracker_running': tracker.running,
-                'irc_connected': bool(tracker.socket),
-                'oauth_configured': bool(tracker.oauth_token),
-                'channel_name': tracker.channel_name,
-                'username': tracker.username
-            },
-            'irc_data': {
-                'connected_users_count': len(tracker.connected_users),
-                'connected_users_list': list(tracker.connected_users)[:10],  # Primeros 10
-                'user_join_times': dict(list(tracker.user_join_times.items())[:5])  # Primeros 5
+                'tracker_running': runtime['tracker_running'],
+                'tracker_role': runtime['role'],
+                'leader_pid': runtime['leader_pid'],
+                'pid': os.getpid(),
+                'oauth_configured': bool(tracker_manager.oauth_token),
+                'channel_name': channel.channel_name,
+                'broadcaster_id': channel.broadcaster_id,
+                'ingest_mode': INGEST_MODE,
+                'irc': runtime['irc']
             },
             'tracker_state': {
-                'current_viewers': len(current_viewers),
-                'current_viewers_list': list(current_viewers.keys()),
-                'left_viewers': len(left_viewers),
-                'total_history': len(all_history)
+                'current_viewers': len(channel.current_viewers),
+                'current_viewers_list': [user['username'] for user in channel.get_viewers()],
+                'left_viewers': channel.total_left,
+                'total_history': channel.total_left,
+                'user_join_times': {
+                    login: session.join_ts
+                    for login, session in itertools.islice(channel.current_viewers.items(), 5)
+                }  # Primeros 5
             },
-            'logs_count': len(tracker.logs),
-            'recent_logs': tracker.logs[-5:] if tracker.logs else [],
+            'logs_count': len(tracker_manager.logs),
+            'recent_logs': logs,
             'timestamp': get_santiago_time()
         })
     except Exception as e:
@@ -1457,42 +5318,47 @@ def debug_endpoint():
     })
 
 # Crear instancia del tracker
-tracker = TwitchTracker()
+tracker_manager = TrackerManager(TRACKED_CHANNELS)
 
 # Función para inicializar el tracker
 def initialize_tracker():
     """Inicializa el tracker API de forma segura"""
     try:
         print("=== INICIANDO TWITCH API TRACKER ===")
-        tracker.add_log("🚀 Iniciando aplicación API...")
-        tracker.add_log(f"📺 Canal: {tracker.channel_name}")
-        tracker.add_log(f"🔑 OAuth configurado: {bool(tracker.oauth_token)}")
-        tracker.add_log(f"⏰ Polling cada: {tracker.poll_interval} segundos")
-        tracker.add_log(f"🔑 OAuth valor: {'***' if tracker.oauth_token else 'NO CONFIGURADO'}")
+        tracker_manager.add_log("🚀 Iniciando aplicación API...", level='info', event='startup')
+        tracker_manager.add_log(f"📺 Canales: {', '.join(tracker_manager.channels)}", level='info', event='startup')
+        tracker_manager.add_log(f"🔑 OAuth configurado: {bool(tracker_manager.oauth_token)}", level='info', event='startup')
+        tracker_manager.add_log(f"⏰ Polling cada: {POLL_INTERVAL} segundos", level='info', event='startup')
+        tracker_manager.add_log(f"🔑 OAuth valor: {'***' if tracker_manager.oauth_token else 'NO CONFIGURADO'}", level='info', event='startup')
         
         # Verificar variables de entorno
         oauth_env = os.getenv('TWITCH_OAUTH')
-        tracker.add_log(f"📋 TWITCH_OAUTH desde env: {'***' if oauth_env else 'NO CONFIGURADO'}")
+        tracker_manager.add_log(f"📋 TWITCH_OAUTH desde env: {'***' if oauth_env else 'NO CONFIGURADO'}", level='info', event='startup')
         
         # Intentar iniciar el tracker
-        tracker.add_log("🔄 Intentando iniciar tracker API...")
-        tracker.start()
+        tracker_manager.add_log("🔄 Intentando iniciar tracker API...", level='info', event='startup')
+        tracker_manager.start()
         
-        if tracker.running:
-            tracker.add_log("✅ Tracker API iniciado correctamente")
+        if tracker_manager.running:
+            tracker_manager.add_log("✅ Tracker API iniciado correctamente", level='info', event='startup')
         else:
-            tracker.add_log("❌ Tracker API no se pudo iniciar")
+            tracker_manager.add_log("❌ Tracker API no se pudo iniciar", level='error', event='startup')
             
     except Exception as e:
         print(f"ERROR inicializando tracker API: {e}")
-        tracker.add_log(f"❌ Error crítico al inicializar: {e}")
+        tracker_manager.add_log(f"❌ Error crítico al inicializar: {e}", level='error', event='startup')
         import traceback
-        tracker.add_log(f"❌ Traceback: {traceback.format_exc()}")
+        tracker_manager.add_log(f"❌ Traceback: {traceback.format_exc()}", level='error', event='startup')
 
 # Inicializar el tracker inmediatamente
 initialize_tracker()
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'tracker':
+        # Proceso dedicado al polling (TRACKER_ROLE=leader), sin servidor web
+        print("📡 Ejecutando solo el tracker")
+        threading.Event().wait()
+    
     # Iniciar el servidor Flask
     port = int(os.getenv('PORT', 3000))
     print(f"🌐 Iniciando servidor en puerto {port}")
@@ -18,6 +18,8 @@ def test_irc_connection():
     oauth_token = os.getenv('TWITCH_OAUTH', '')
     username = 'blackcraneo'
     channel = 'blackcraneo'
+    host = os.getenv('IRC_HOST', 'irc.chat.twitch.tv')
+    port = int(os.getenv('IRC_PORT', 6667))
     
     if not oauth_token:
         print("❌ ERROR: TWITCH_OAUTH no configurado")
@@ -32,7 +34,7 @@ def test_irc_connection():
     try:
         # Conectar a IRC
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(('irc.chat.twitch.tv', 6667))
+        sock.connect((host, port))
         print("✅ Conectado al servidor IRC")
         
         # Autenticación
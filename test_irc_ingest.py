@@ -0,0 +1,141 @@
+"""
+Pruebas de la ingesta IRC contra un servidor IRC local falso
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+CHANNEL = 'testchan'
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    """Importa la app con una base de datos temporal y sin tracker en marcha"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp('irc'))
+        monkeypatch.setenv('TWITCH_CHANNELS', CHANNEL)
+        monkeypatch.setenv('TWITCH_OAUTH', '')
+        monkeypatch.setenv('INGEST_MODE', 'irc')
+        import app
+        yield app
+
+
+class FakeIRCServer:
+    """Servidor IRC de una sola conexión que guarda las líneas recibidas"""
+
+    def __init__(self):
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.conn = None
+        self.lines = []
+        self.buffer = b''
+        self.accepted = threading.Event()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        self.conn, _ = self.listener.accept()
+        self.conn.settimeout(5)
+        self.accepted.set()
+
+    def send(self, data):
+        self.conn.sendall(data)
+
+    def wait_for(self, prefix, timeout=5):
+        """Lee hasta recibir una línea que empiece con prefix"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            for line in self.lines:
+                if line.startswith(prefix):
+                    return line
+            data = self.conn.recv(4096)
+            if not data:
+                break
+            self.buffer += data
+            *lines, self.buffer = self.buffer.split(b'\r\n')
+            self.lines.extend(line.decode('utf-8') for line in lines)
+        raise AssertionError(f'no se recibió {prefix!r}: {self.lines}')
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+        self.listener.close()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_parse_irc_line(app_module):
+    parse = app_module.parse_irc_line
+    assert parse('PING :tmi.twitch.tv') == ('', 'PING', ['tmi.twitch.tv'])
+    assert parse('@badge-info=;color= :alice!alice@alice.tmi.twitch.tv JOIN #testchan') == (
+        'alice!alice@alice.tmi.twitch.tv', 'JOIN', ['#testchan']
+    )
+    assert parse(':tmi.twitch.tv 001 nick :Welcome, GLHF!') == ('tmi.twitch.tv', '001', ['nick', 'Welcome, GLHF!'])
+    assert parse(':tmi.twitch.tv RECONNECT') == ('tmi.twitch.tv', 'RECONNECT', [])
+
+
+def test_irc_session(app_module):
+    manager = app_module.tracker_manager
+    channel = manager.get_channel(CHANNEL)
+    server = FakeIRCServer()
+    ingestor = app_module.IRCIngestor(manager, host='127.0.0.1', port=server.port, nick='testnick')
+    result = {}
+
+    def run_session():
+        ingestor.connect()
+        result['authenticated'] = ingestor.session()
+        ingestor.close()
+
+    manager.running = True
+    manager.oauth_token = 'oauth:test'
+    session_thread = threading.Thread(target=run_session, daemon=True)
+    try:
+        session_thread.start()
+        assert server.accepted.wait(5)
+
+        # Registro: capacidad de membresía, credenciales y JOIN del canal
+        assert server.wait_for('CAP REQ') == 'CAP REQ :twitch.tv/membership'
+        assert server.wait_for('PASS') == 'PASS oauth:test'
+        assert server.wait_for('NICK') == 'NICK testnick'
+        assert server.wait_for('JOIN') == f'JOIN #{CHANNEL}'
+        server.send(b':tmi.twitch.tv CAP * ACK :twitch.tv/membership\r\n:tmi.twitch.tv 001 testnick :Welcome, GLHF!\r\n')
+        assert wait_until(lambda: ingestor.connected)
+
+        server.send(b'PING :tmi.twitch.tv\r\n')
+        assert server.wait_for('PONG') == 'PONG :tmi.twitch.tv'
+
+        # Una línea cortada entre dos paquetes se procesa al completarse
+        server.send(
+            f':alice!alice@alice.tmi.twitch.tv JOIN #{CHANNEL}\r\n'
+            f'@tag=1 :bob!bob@bob.tmi.twitch.tv JOIN #{CHANNEL}\r\n:bob!bob@bob.tmi.twitch.tv PA'.encode()
+        )
+        assert wait_until(lambda: set(channel.current_viewers) == {'alice', 'bob'})
+        server.send(f'RT #{CHANNEL}\r\n:carol!carol@carol.tmi.twitch.tv JOIN #otherchan\r\n'.encode())
+        assert wait_until(lambda: set(channel.current_viewers) == {'alice'})
+
+        server.send(b':tmi.twitch.tv RECONNECT\r\n')
+        session_thread.join(5)
+        assert not session_thread.is_alive()
+        assert result['authenticated'] is True
+    finally:
+        manager.running = False
+        server.close()
+
+    assert set(channel.current_viewers) == {'alice'}
+    assert channel.total_left == 1
+    changes = [
+        (change['event'], change['login'])
+        for change in manager.db.get_changes_after(0)
+        if change['channel'] == CHANNEL
+    ]
+    assert changes == [('join', 'alice'), ('join', 'bob'), ('leave', 'bob')]
+    assert ingestor.events_received == 3